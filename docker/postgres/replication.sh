@@ -0,0 +1,5 @@
+#!/bin/bash
+set -e
+
+# Разрешаем потоковую репликацию для локальной реплики из docker-compose
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
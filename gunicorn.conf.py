@@ -0,0 +1,117 @@
+import gc
+import math
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _available_cpus():
+    # Лимит CPU контейнера (cgroup v2) важнее числа ядер хоста
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _connections_per_worker():
+    from src.database import CANCEL_EXECUTOR_WORKERS, db
+
+    # Соединение с primary для запросов, по одному на реплику, LISTEN users_changes
+    # и до CANCEL_EXECUTOR_WORKERS одновременных соединений PQcancel
+    return 1 + len(db.replica_dsns) + 1 + CANCEL_EXECUTOR_WORKERS
+
+
+def _max_workers_for_database(connections_per_worker):
+    max_connections = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+    reserved_connections = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+    app_instances = int(os.getenv("APP_INSTANCES", "1"))
+
+    budget = (max_connections - reserved_connections) // app_instances
+    return max(1, budget // connections_per_worker)
+
+
+def _drain_before_stop(server):
+    """Обработчик SIGTERM мастера: снять готовность, подождать, затем штатная остановка.
+
+    Воркеры сигнала не получают и продолжают обслуживать запросы, пока
+    балансировщик выводит инстанс из ротации; через shutdown_drain_seconds
+    сигнал передается обычному обработчику gunicorn (Arbiter.signal), и
+    воркеры останавливаются в пределах graceful_timeout. Повторный SIGTERM
+    останавливает сразу.
+    """
+    from main import shutdown_draining
+
+    timer = None
+
+    def handle_sigterm(sig, frame):
+        nonlocal timer
+        if timer is not None:
+            timer.cancel()
+            server.signal(sig, frame)
+            return
+
+        shutdown_draining.value = 1
+        server.log.info("SIGTERM: готовность снята, остановка через %.1f с", shutdown_drain_seconds)
+        timer = threading.Timer(shutdown_drain_seconds, server.signal, (sig, None))
+        timer.daemon = True
+        timer.start()
+
+    return handle_sigterm
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+connections_per_worker = _connections_per_worker()
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or min(
+    _available_cpus(), _max_workers_for_database(connections_per_worker)
+)
+
+# Приложение импортируется в мастере до fork: код, схема OpenAPI и mmap фильтра
+# утекших паролей разделяются воркерами через copy-on-write
+preload_app = True
+worker_tmp_dir = "/dev/shm"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# По SIGTERM мастер сначала SHUTDOWN_DRAIN_SECONDS держит /health/ready в 503, пока
+# воркеры обслуживают запросы, и только потом останавливает их (см. _drain_before_stop);
+# graceful_timeout отсчитывается уже после паузы
+shutdown_drain_seconds = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "5"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Общий бюджет кеша пользователей делится между воркерами, чтобы память
+# не росла пропорционально их числу
+os.environ.setdefault(
+    "USER_CACHE_SIZE",
+    str(int(os.getenv("USER_CACHE_TOTAL_SIZE", "40000")) // workers),
+)
+
+
+def when_ready(server):
+    from main import warm_up_process
+
+    warm_up_process()
+    # Объекты, созданные до fork, не будут трогаться сборщиком мусора в воркерах,
+    # иначе обновление их заголовков копирует разделяемые страницы
+    gc.freeze()
+    # Вызывается после того, как Arbiter установил свои обработчики сигналов
+    if shutdown_drain_seconds > 0:
+        signal.signal(signal.SIGTERM, _drain_before_stop(server))
+    server.log.info(
+        "Воркеров: %s, соединений с БД на воркер: %s, USER_CACHE_SIZE=%s",
+        workers,
+        connections_per_worker,
+        os.environ["USER_CACHE_SIZE"],
+    )
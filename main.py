@@ -1,6 +1,79 @@
-from fastapi import FastAPI
+import time
+
+# Отсчет до остальных импортов: IMPORT_SECONDS в логе старта включает импорт
+# FastAPI, psycopg2 и роутеров, поэтому импорты ниже намеренно идут после него (E402)
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import multiprocessing  # noqa: E402
+from contextlib import asynccontextmanager  # noqa: E402
+from datetime import datetime  # noqa: E402
+
+from fastapi import FastAPI, Request, Response, status  # noqa: E402
+from fastapi.concurrency import run_in_threadpool  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from psycopg2.errors import QueryCanceled  # noqa: E402
+
+from src.activity import activity_tracker  # noqa: E402
+from src.admission import AdmissionControlMiddleware, ClientDisconnectMiddleware  # noqa: E402
+from src.auth import warm_up_hashing  # noqa: E402
+from src.database import QueryDeadlineExceeded, db  # noqa: E402
+from src.events import auth_events  # noqa: E402
+from src.notifications import user_change_feed  # noqa: E402
+from src.password_policy import get_breached_filter  # noqa: E402
+from src.replication import ReadYourWritesMiddleware, replica_lag_monitor  # noqa: E402
+from src.routes import admin, auth, profile, users  # noqa: E402
+from src.schemas import HealthCheckResponse  # noqa: E402
+
+process_warmed_up = False
+
+
+def warm_up_process():
+    """Прогрев без обращений к БД: bcrypt, фильтр утекших паролей и схема OpenAPI.
+
+    В многопроцессном режиме вызывается в мастере gunicorn до fork,
+    поэтому воркеры получают уже прогретое состояние.
+    """
+    global process_warmed_up
+    if process_warmed_up:
+        return
+
+    warm_up_hashing()
+    get_breached_filter()
+    app.openapi()
+    process_warmed_up = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_started = time.perf_counter()
+    await asyncio.gather(
+        run_in_threadpool(warm_up_process),
+        run_in_threadpool(db.warm_up),
+    )
+
+    auth_events.start()
+    activity_tracker.start()
+    user_change_feed.start()
+    replica_lag_monitor.start()
+
+    app.state.ready = True
+    print(
+        f"Импорт приложения: {IMPORT_SECONDS:.3f} с, "
+        f"прогрев: {time.perf_counter() - warm_up_started:.3f} с"
+    )
+
+    yield
+
+    # Готовность снята еще по SIGTERM мастера (gunicorn.conf.py), uvicorn дождался
+    # запросов в обработке; остается остановить фоновые задачи и закрыть соединения с БД
+    app.state.ready = False
+    await replica_lag_monitor.stop()
+    await user_change_feed.stop()
+    await activity_tracker.stop()
+    await auth_events.stop()
+    db.disconnect()
 
-from src.routes import admin, auth, profile, users
 
 app = FastAPI(
     title="Сервис Авторизации",
@@ -8,7 +81,57 @@ app = FastAPI(
     description="Тестовое задание InstallBiz",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
+app.state.ready = False
+
+# Флаг остановки, общий для мастера gunicorn и воркеров: создается в мастере до fork
+# (preload_app), по SIGTERM его поднимает мастер (gunicorn.conf.py), воркеры читают
+shutdown_draining = multiprocessing.RawValue("b", 0)
+
+
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+# Внешний слой: отмена при отключении клиента освобождает и слот admission
+app.add_middleware(ClientDisconnectMiddleware)
+
+
+@app.exception_handler(QueryCanceled)
+@app.exception_handler(QueryDeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        {"detail": "Превышено время обработки запроса"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.get(
+    "/health/live",
+    response_model=HealthCheckResponse,
+    summary="Проверка живости",
+    description="Процесс запущен и обрабатывает запросы"
+)
+async def liveness():
+    return HealthCheckResponse(status="alive", version=app.version, timestamp=datetime.utcnow())
+
+
+@app.get(
+    "/health/ready",
+    response_model=HealthCheckResponse,
+    summary="Проверка готовности",
+    description="Соединения с БД открыты и прогрев завершен; 503 во время запуска и после SIGTERM"
+)
+async def readiness(response: Response):
+    draining = bool(shutdown_draining.value)
+    if draining or not app.state.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return HealthCheckResponse(
+            status="draining" if draining else "starting",
+            version=app.version,
+            timestamp=datetime.utcnow()
+        )
+    return HealthCheckResponse(status="ready", version=app.version, timestamp=datetime.utcnow())
 
 
 @app.get(
@@ -33,3 +156,5 @@ app.include_router(auth.router)
 app.include_router(profile.router)
 app.include_router(users.router)
 app.include_router(admin.router)
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
@@ -9,9 +9,46 @@ CREATE TABLE IF NOT EXISTS users (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login_at TIMESTAMP;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(20) NOT NULL DEFAULT 'user';
+
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
-CREATE INDEX IF NOT EXISTS idx_users_is_active ON users(is_active);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at DESC);
+
+-- Частичный индекс повторяет условие и порядок выборки /admin/users/inactive
+-- (см. scripts/check_query_plans.py)
+CREATE INDEX IF NOT EXISTS idx_users_inactive_created_at ON users(created_at DESC) WHERE is_active = FALSE;
+
+-- last_login_at/last_seen_at обновляются ActivityTracker каждые 30 с и не индексируются:
+-- тогда UPDATE активности идет как HOT и не трогает ни один индекс, включая триграммные.
+-- С индексом по last_seen_at на 100 тыс. строк HOT было 0% (6.3 с, +44 МБ таблицы и
+-- индексов), без него с fillfactor 90 - 89% (1.2 с, +6.7 МБ). Отчет /admin/users/dormant
+-- читает таблицу целиком; fillfactor действует на страницы, записанные после ALTER
+DROP INDEX IF EXISTS idx_users_active_last_seen;
+
+ALTER TABLE users SET (fillfactor = 90);
+
+DROP INDEX IF EXISTS idx_users_last_seen_at;
+
+DROP INDEX IF EXISTS idx_users_is_active;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- ILIKE по email, в том числе фильтр домена в массовом изменении статуса
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING GIN (email gin_trgm_ops);
+
+-- Поиск /users/search: GiST отдает ближайших кандидатов по расстоянию <<-> (KNN),
+-- поэтому страница не ранжирует все совпадения. Выражение совпадает с SEARCH_TEXT в src/queries.py
+CREATE INDEX IF NOT EXISTS idx_users_search_trgm
+    ON users USING GIST ((email || ' ' || first_name || ' ' || last_name) gist_trgm_ops);
+
+DROP INDEX IF EXISTS idx_users_first_name_trgm;
+
+DROP INDEX IF EXISTS idx_users_last_name_trgm;
 
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -21,17 +58,100 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- last_login_at/last_seen_at не входят в список: отметки активности не меняют updated_at
 DROP TRIGGER IF EXISTS update_users_updated_at ON users;
 CREATE TRIGGER update_users_updated_at
-    BEFORE UPDATE ON users
+    BEFORE UPDATE OF email, password_hash, first_name, last_name, is_active, role ON users
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
-INSERT INTO users (email, password_hash, first_name, last_name, is_active)
+-- Уведомления об изменениях пользователей для инвалидации кешей воркеров и потока изменений
+CREATE OR REPLACE FUNCTION notify_users_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed users%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    PERFORM pg_notify('users_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', changed.id,
+        'is_active', changed.is_active,
+        'updated_at', changed.updated_at
+    )::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_users_change ON users;
+CREATE TRIGGER notify_users_change
+    AFTER INSERT OR DELETE OR UPDATE OF email, password_hash, first_name, last_name, is_active, role ON users
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_users_change();
+
+CREATE TABLE IF NOT EXISTS auth_events (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    event_type VARCHAR(50) NOT NULL,
+    user_id INTEGER,
+    actor_id INTEGER,
+    email VARCHAR(255),
+    ip_address VARCHAR(45),
+    details JSONB
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS auth_events_default PARTITION OF auth_events DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_auth_events_user_id ON auth_events(user_id, created_at);
+
+-- Месячные партиции создаются заранее: здесь и в AuthEventLog.ensure_partitions при старте
+-- сервиса и смене месяца. auth_events_default должна оставаться пустой: если в ней окажутся
+-- строки месяца, партицию за этот месяц создать уже не получится. Старые удаляются через DROP TABLE
+CREATE OR REPLACE FUNCTION create_auth_events_partition(month DATE)
+RETURNS VOID AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month);
+    end_date DATE := date_trunc('month', month) + INTERVAL '1 month';
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF auth_events FOR VALUES FROM (%L) TO (%L)',
+        'auth_events_' || to_char(start_date, 'YYYY_MM'),
+        start_date,
+        end_date
+    );
+END;
+$$ language 'plpgsql';
+
+SELECT create_auth_events_partition((CURRENT_DATE + make_interval(months => n))::date)
+FROM generate_series(0, 2) AS n;
+
+CREATE OR REPLACE FUNCTION forbid_auth_events_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'auth_events is append-only';
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS auth_events_append_only ON auth_events;
+CREATE TRIGGER auth_events_append_only
+    BEFORE UPDATE OR DELETE ON auth_events
+    FOR EACH ROW
+    EXECUTE FUNCTION forbid_auth_events_changes();
+
+INSERT INTO users (email, password_hash, first_name, last_name, is_active, role)
 VALUES (
     'admin@example.com',
     '$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW', -- password: secret
     'Admin',
     'User',
-    true
-) ON CONFLICT (email) DO NOTHING;
\ No newline at end of file
+    true,
+    'admin'
+)
+-- Админ, созданный до появления колонки role, получил DEFAULT 'user': возвращаем роль,
+-- пароль и остальные поля существующей записи не трогаем
+ON CONFLICT (email) DO UPDATE SET role = 'admin'
+WHERE users.role <> 'admin';
\ No newline at end of file
@@ -0,0 +1,458 @@
+"""Проверка планов SQL-запросов сервиса на реалистичном объеме данных.
+
+Скрипт создает временную схему query_plan_check с копиями таблиц users и
+auth_events (со всеми индексами из public), заполняет users синтетическими
+пользователями, выполняет EXPLAIN (ANALYZE, BUFFERS) для каждого запроса из
+src/queries.py и завершается с ненулевым кодом, если план деградировал до
+Seq Scan по users или превысил бюджет по буферам/времени. Для проблемных
+запросов печатаются рекомендации по индексам.
+
+Запрос из src/queries.py без примера параметров в build_queries (и не
+перечисленный в UNCHECKED) тоже считается ошибкой, поэтому новый запрос
+нельзя добавить, не проверив его план.
+
+    python scripts/check_query_plans.py --rows 500000
+
+Та же проверка запускается в pytest (tests/test_query_plans.py, маркер postgres),
+если задан QUERY_PLAN_DSN.
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from psycopg2.extras import Json  # noqa: E402
+
+from src import queries  # noqa: E402
+from src.database import Database  # noqa: E402
+
+SCHEMA = "query_plan_check"
+
+SEED_QUERY = """
+    INSERT INTO users (
+        id, email, password_hash, first_name, last_name, is_active,
+        created_at, updated_at, last_login_at, last_seen_at, role
+    )
+    SELECT n,
+           'user' || n || '@' || (ARRAY['example.com', 'corp.example', 'mail.test', 'company.org'])[1 + n %% 4],
+           '$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW',
+           (ARRAY['Ivan', 'Petr', 'Anna', 'Maria', 'Aleksei', 'Elena', 'Dmitrii', 'Olga'])[1 + n %% 8],
+           initcap(substr(md5(n::text), 1, 10)),
+           n %% 50 <> 0,
+           now() - make_interval(mins => %(rows)s - n),
+           now() - make_interval(mins => %(rows)s - n),
+           CASE WHEN n %% 10 = 0 THEN NULL ELSE now() - make_interval(days => n %% 365) END,
+           CASE WHEN n %% 10 = 0 THEN NULL ELSE now() - make_interval(days => n %% 365) END,
+           CASE WHEN n %% 1000 = 0 THEN 'admin' ELSE 'user' END
+    FROM generate_series(1, %(rows)s) AS n
+"""
+
+# Бюджет буферов массового изменения статуса порцией в 1000 строк
+BULK_MAX_BUFFERS = 40000
+
+# Запросы, план которых не проверяется, с причиной
+UNCHECKED = {
+    "CREATE_PARTITION_QUERY": "DDL внутри функции, EXPLAIN показывает только вызов",
+}
+
+
+class QueryCase:
+    def __init__(self, source, name, query, params=None, allow_seq_scan=False, max_buffers=500, max_ms=50.0):
+        self.source = source
+        self.name = name
+        self.query = query
+        self.params = params
+        self.allow_seq_scan = allow_seq_scan
+        self.max_buffers = max_buffers
+        self.max_ms = max_ms
+
+
+def _values(query, template):
+    # execute_values подставляет строки вместо VALUES %s; для EXPLAIN хватает одной
+    return query.replace("VALUES %s", f"VALUES {template}")
+
+
+def build_queries(rows):
+    sample_id = rows // 2
+    sample_email = f"user{sample_id}@example.com"
+    sample_last_name = hashlib.md5(str(sample_id).encode()).hexdigest()[:10].capitalize()
+    sample_ids = list(range(sample_id, sample_id + 1000))
+    cutoff = datetime.utcnow() - timedelta(days=90)
+    created_before = datetime.utcnow() - timedelta(minutes=rows - 1000)
+    now = datetime.utcnow()
+
+    return [
+        QueryCase(
+            "USER_BY_ID_QUERY",
+            "get_current_user / get_user_by_id",
+            queries.USER_BY_ID_QUERY,
+            (sample_id,),
+        ),
+        QueryCase(
+            "USER_VERSION_BY_ID_QUERY",
+            "get_user_by_id: version probe",
+            queries.USER_VERSION_BY_ID_QUERY,
+            (sample_id,),
+        ),
+        QueryCase(
+            "USER_ID_BY_EMAIL_QUERY",
+            "register: email check",
+            queries.USER_ID_BY_EMAIL_QUERY,
+            (sample_email,),
+        ),
+        QueryCase(
+            "INSERT_USER_QUERY",
+            "register: insert",
+            queries.INSERT_USER_QUERY,
+            ("plan-check@example.com", "$2b$12$hash", "Plan", "Check", True),
+        ),
+        QueryCase(
+            "USER_CREDENTIALS_BY_EMAIL_QUERY",
+            "login: user by email",
+            queries.USER_CREDENTIALS_BY_EMAIL_QUERY,
+            (sample_email,),
+        ),
+        QueryCase(
+            "USER_PAGE_QUERY",
+            "get_all_users: page",
+            queries.USER_PAGE_QUERY,
+            (10, 100),
+        ),
+        QueryCase(
+            "USER_COUNT_QUERY",
+            "get_all_users: total",
+            queries.USER_COUNT_QUERY,
+            allow_seq_scan=True,
+            max_buffers=max(5000, rows // 20),
+            max_ms=500.0,
+        ),
+        QueryCase(
+            "USER_COUNT_ESTIMATE_QUERY",
+            "get_all_users: estimated total",
+            queries.USER_COUNT_ESTIMATE_QUERY,
+        ),
+        QueryCase(
+            "SEARCH_USERS_QUERY",
+            "search_users: email prefix",
+            queries.SEARCH_USERS_QUERY,
+            {
+                "q": f"user{sample_id}",
+                "prefix": f"user{sample_id}%",
+                "limit": 21,
+                "candidates": queries.SEARCH_CANDIDATE_LIMIT,
+            },
+            # KNN-обход GiST ограничен числом кандидатов, а не числом совпадений
+            max_buffers=8000,
+            max_ms=300.0,
+        ),
+        QueryCase(
+            "SEARCH_USERS_QUERY",
+            "search_users: fuzzy last name",
+            queries.SEARCH_USERS_QUERY,
+            {
+                "q": sample_last_name[:-1],
+                "prefix": f"{sample_last_name[:-1]}%",
+                "limit": 21,
+                "candidates": queries.SEARCH_CANDIDATE_LIMIT,
+            },
+            # KNN-обход GiST ограничен числом кандидатов, а не числом совпадений
+            max_buffers=8000,
+            max_ms=300.0,
+        ),
+        QueryCase(
+            "SEARCH_USERS_AFTER_CURSOR_QUERY",
+            "search_users: next page by cursor",
+            queries.SEARCH_USERS_AFTER_CURSOR_QUERY,
+            {
+                "q": "user1",
+                "prefix": "user1%",
+                "limit": 21,
+                "candidates": queries.SEARCH_CANDIDATE_LIMIT,
+                "cursor_rank": Decimal("1.5"),
+                "cursor_id": sample_id,
+            },
+            # KNN-обход GiST ограничен числом кандидатов, а не числом совпадений
+            max_buffers=8000,
+            max_ms=300.0,
+        ),
+        QueryCase(
+            "USER_STATUSES_BY_IDS_QUERY",
+            "introspect_tokens: statuses",
+            queries.USER_STATUSES_BY_IDS_QUERY,
+            (sample_ids[:100],),
+        ),
+        QueryCase(
+            "update_profile_query",
+            "update_user_profile",
+            queries.update_profile_query(queries.PROFILE_COLUMNS),
+            ("Ivan", "Petrov", True, sample_id),
+        ),
+        QueryCase(
+            "DEACTIVATE_USER_QUERY",
+            "deactivate_own_account",
+            queries.DEACTIVATE_USER_QUERY,
+            (sample_id,),
+        ),
+        QueryCase(
+            "USER_STATUS_BY_ID_QUERY",
+            "get_user_status",
+            queries.USER_STATUS_BY_ID_QUERY,
+            (sample_id,),
+        ),
+        QueryCase(
+            "SET_USER_STATUS_QUERY",
+            "set_user_status / activate / deactivate",
+            queries.SET_USER_STATUS_QUERY,
+            (False, sample_id),
+        ),
+        QueryCase(
+            "INACTIVE_USERS_QUERY",
+            "get_inactive_users",
+            queries.INACTIVE_USERS_QUERY,
+            # Без LIMIT: каждый 50-й пользователь неактивен и лежит на своей странице,
+            # плюс страницы частичного индекса
+            max_buffers=max(500, rows // 40),
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "DORMANT_USERS_QUERY",
+            "get_dormant_users",
+            queries.DORMANT_USERS_QUERY,
+            (cutoff, 100),
+            # Индекса по last_seen_at нет намеренно (HOT-обновления активности):
+            # отчет читает всю таблицу, бюджет растет с ее размером
+            allow_seq_scan=True,
+            max_buffers=max(500, rows // 30),
+            max_ms=max(50.0, rows / 1000),
+        ),
+        # Смена is_active не бывает HOT (колонка в условии частичного индекса), поэтому каждая
+        # из 1000 строк вставляется во все индексы users, включая GIN и GiST pg_trgm:
+        # около 30 буферов на строку
+        QueryCase(
+            "bulk_status_by_ids_query",
+            "bulk_set_user_status: ids",
+            queries.bulk_status_by_ids_query([]),
+            (False, sample_ids),
+            max_buffers=BULK_MAX_BUFFERS,
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "bulk_status_by_ids_query",
+            "bulk_set_user_status: ids + email_domain",
+            queries.bulk_status_by_ids_query([queries.BULK_EMAIL_DOMAIN_CONDITION]),
+            (False, sample_ids, "%@example.com"),
+            max_buffers=BULK_MAX_BUFFERS,
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "bulk_status_by_filters_query",
+            "bulk_set_user_status: created_before",
+            queries.bulk_status_by_filters_query([queries.BULK_CREATED_BEFORE_CONDITION]),
+            (False, False, created_before, 1000),
+            max_buffers=BULK_MAX_BUFFERS,
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "bulk_status_by_filters_query",
+            "bulk_set_user_status: email_domain",
+            queries.bulk_status_by_filters_query([queries.BULK_EMAIL_DOMAIN_CONDITION]),
+            (False, False, "%@mail.test", 1000),
+            max_buffers=BULK_MAX_BUFFERS,
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "bulk_status_by_filters_query",
+            "bulk_set_user_status: created_before + email_domain",
+            queries.bulk_status_by_filters_query([
+                queries.BULK_CREATED_BEFORE_CONDITION,
+                queries.BULK_EMAIL_DOMAIN_CONDITION,
+            ]),
+            (False, False, created_before, "%@mail.test", 1000),
+            max_buffers=BULK_MAX_BUFFERS,
+            max_ms=200.0,
+        ),
+        QueryCase(
+            "UPDATE_ACTIVITY_QUERY",
+            "activity_tracker: flush",
+            _values(queries.UPDATE_ACTIVITY_QUERY, queries.UPDATE_ACTIVITY_TEMPLATE),
+            (sample_id, now, now),
+        ),
+        QueryCase(
+            "INSERT_EVENTS_QUERY",
+            "auth_events: flush",
+            _values(queries.INSERT_EVENTS_QUERY, queries.INSERT_EVENTS_TEMPLATE),
+            (now, "login_succeeded", sample_id, None, sample_email, "127.0.0.1", Json({"source": "plan_check"})),
+        ),
+        QueryCase(
+            "PARTITION_EXISTS_QUERY",
+            "auth_events: partition check",
+            queries.PARTITION_EXISTS_QUERY,
+            (f"auth_events_{now:%Y_%m}",),
+        ),
+    ]
+
+
+def uncovered_queries(cases):
+    """Запросы из src/queries.py, для которых нет ни одного случая в build_queries."""
+    names = {
+        name for name, value in vars(queries).items()
+        if (name.endswith("_QUERY") and isinstance(value, str))
+        or (name.endswith("_query") and callable(value))
+    }
+    return sorted(names - {case.source for case in cases} - set(UNCHECKED))
+
+
+def iter_nodes(node, parents=()):
+    yield node, parents
+    for child in node.get("Plans", []):
+        yield from iter_nodes(child, parents + (node,))
+
+
+def recommend_index(plan):
+    """Подбирает индекс по узлам Seq Scan и Sort в плане."""
+    recommendations = []
+
+    for node, parents in iter_nodes(plan):
+        sort_keys = next(
+            (parent["Sort Key"] for parent in reversed(parents) if parent.get("Node Type") == "Sort"),
+            None,
+        )
+
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") == "users":
+            condition = node.get("Filter", "")
+            columns = sorted(set(re.findall(r"\b([a-z_]+)\b(?=\s*(?:[<>=!~]|IS\b|IS NOT\b))", condition)))
+            predicate = None
+            if re.search(r"\(NOT is_active\)|is_active = false", condition):
+                predicate = "is_active = FALSE"
+            elif re.search(r"\bis_active\b(?!\s*=)", condition):
+                predicate = "is_active = TRUE"
+            columns = [column for column in columns if column != "is_active"]
+
+            key = ", ".join(sort_keys) if sort_keys else ", ".join(columns) or "<колонки фильтра>"
+            statement = f"CREATE INDEX ON users ({key})"
+            if predicate:
+                # Булев флаг с низкой селективностью полезнее как условие частичного индекса
+                statement += f" WHERE {predicate}"
+            recommendations.append(f"{statement};  -- Seq Scan, фильтр: {condition or 'нет'}")
+
+        elif node.get("Node Type") == "Sort" and any(p.get("Node Type") == "Limit" for p in parents):
+            recommendations.append(
+                f"CREATE INDEX ON users ({', '.join(node['Sort Key'])});  -- Top-N сортировка под LIMIT"
+            )
+
+    return recommendations
+
+
+def check_case(cursor, case):
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {case.query}", case.params)
+    result = cursor.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    plan = result[0]["Plan"]
+    execution_ms = result[0]["Execution Time"]
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+
+    problems = []
+    seq_scans = [
+        node for node, _ in iter_nodes(plan)
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") == "users"
+    ]
+    if seq_scans and not case.allow_seq_scan:
+        problems.append("Seq Scan по users")
+    if buffers > case.max_buffers:
+        problems.append(f"буферов {buffers} > {case.max_buffers}")
+    if execution_ms > case.max_ms:
+        problems.append(f"время {execution_ms:.1f} мс > {case.max_ms:.1f} мс")
+
+    return plan, execution_ms, buffers, problems
+
+
+def seed(conn, rows):
+    with conn.cursor() as cursor:
+        # Заполнение и ANALYZE большой таблицы не укладываются в statement_timeout сервиса
+        cursor.execute("SET statement_timeout = 0")
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path = {SCHEMA}, public")
+
+        cursor.execute("CREATE TABLE users (LIKE public.users INCLUDING ALL)")
+        # LIKE копирует DEFAULT с последовательностью public.users: INSERT из проверки
+        # получил бы id из нее и конфликтовал с синтетическими id
+        cursor.execute("CREATE SEQUENCE users_id_seq OWNED BY users.id")
+        cursor.execute(f"ALTER TABLE users ALTER COLUMN id SET DEFAULT nextval('{SCHEMA}.users_id_seq')")
+        cursor.execute(SEED_QUERY, {"rows": rows})
+        cursor.execute(f"SELECT setval('{SCHEMA}.users_id_seq', %s)", (rows,))
+
+        cursor.execute(
+            "CREATE TABLE auth_events (LIKE public.auth_events INCLUDING ALL) PARTITION BY RANGE (created_at)"
+        )
+        # Функция создает партицию в первой схеме search_path, то есть здесь
+        cursor.execute(queries.CREATE_PARTITION_QUERY, (datetime.utcnow().date(),))
+
+        cursor.execute("ANALYZE users")
+    conn.commit()
+
+
+def run_checks(conn, rows, keep=False):
+    """Заполняет схему проверки, проверяет все случаи и возвращает список проблем."""
+    cases = build_queries(rows)
+    failures = []
+
+    for name in uncovered_queries(cases):
+        failures.append(f"{name}: нет примера параметров в build_queries")
+        print(f"[FAIL] {name}: нет примера параметров в build_queries")
+
+    try:
+        print(f"Заполнение {SCHEMA}: {rows} пользователей...")
+        seed(conn, rows)
+
+        for case in cases:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SET search_path = {SCHEMA}, public")
+                plan, execution_ms, buffers, problems = check_case(cursor, case)
+            # EXPLAIN ANALYZE выполняет INSERT/UPDATE, поэтому изменения каждого случая откатываются
+            conn.rollback()
+
+            mark = "FAIL" if problems else "ok"
+            print(f"[{mark:>4}] {case.name}: {execution_ms:.2f} мс, буферов {buffers}")
+            if problems:
+                failures.append(f"{case.name}: {'; '.join(problems)}")
+                print(f"       проблемы: {'; '.join(problems)}")
+                for recommendation in recommend_index(plan):
+                    print(f"       рекомендация: {recommendation}")
+    finally:
+        if not keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Регрессионная проверка планов SQL-запросов")
+    parser.add_argument("--rows", type=int, default=200000, help="Количество синтетических пользователей")
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему с данными после проверки")
+    args = parser.parse_args()
+
+    database = Database()
+    conn = database.open_connection(database.primary_dsn)
+    try:
+        failures = run_checks(conn, args.rows, keep=args.keep)
+    finally:
+        conn.close()
+
+    if failures:
+        print(f"Проблемных запросов: {len(failures)}")
+        sys.exit(1)
+    print("Все планы в пределах бюджета")
+
+
+if __name__ == "__main__":
+    main()
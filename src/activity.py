@@ -0,0 +1,97 @@
+import asyncio
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from src.database import db
+from src.queries import UPDATE_ACTIVITY_QUERY, UPDATE_ACTIVITY_TEMPLATE
+
+load_dotenv()
+
+# Строк в одном UPDATE ... FROM (VALUES ...): большой сброс идет несколькими запросами
+ACTIVITY_FLUSH_PAGE_SIZE = 1000
+
+
+class ActivityTracker:
+    """Накопитель отметок last_login_at/last_seen_at.
+
+    Запросы только обновляют словарь в памяти; раз в flush_interval секунд
+    все накопленные отметки записываются одним UPDATE ... FROM (VALUES ...).
+    Повторные обращения одного пользователя между сбросами схлопываются в одну строку.
+    """
+
+    def __init__(self, flush_interval=30.0):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._task = None
+
+    def record_seen(self, user_id):
+        self._touch(int(user_id), login=False)
+
+    def record_login(self, user_id):
+        self._touch(int(user_id), login=True)
+
+    def _touch(self, user_id, login):
+        now = datetime.utcnow()
+        last_login_at = self._pending.get(user_id, (None, None))[0]
+        self._pending[user_id] = (now if login else last_login_at, now)
+
+    def _restore(self, pending):
+        for user_id, (last_login_at, last_seen_at) in pending.items():
+            newer_login, newer_seen = self._pending.get(user_id, (None, None))
+            self._pending[user_id] = (newer_login or last_login_at, newer_seen or last_seen_at)
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        # Строки блокируются в порядке id, как и в массовом изменении статуса,
+        # поэтому параллельные сбросы воркеров не образуют дедлоков
+        rows = sorted(
+            (user_id, last_login_at, last_seen_at)
+            for user_id, (last_login_at, last_seen_at) in pending.items()
+        )
+
+        try:
+            # GREATEST делает повторное применение безопасным, поэтому повтор разрешен
+            # и после потери соединения
+            await db.execute_values_async(
+                UPDATE_ACTIVITY_QUERY,
+                rows,
+                template=UPDATE_ACTIVITY_TEMPLATE,
+                page_size=ACTIVITY_FLUSH_PAGE_SIZE,
+                idempotent=True,
+            )
+        except asyncio.CancelledError:
+            self._restore(pending)
+            raise
+        except Exception as e:
+            # Возвращаем отметки обратно: объем ограничен числом активных пользователей
+            self._restore(pending)
+            print(f"Ошибка при записи активности пользователей: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+activity_tracker = ActivityTracker(
+    flush_interval=float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30")),
+)
@@ -0,0 +1,201 @@
+import asyncio
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from src.database import statement_deadline
+
+load_dotenv()
+
+
+class ConcurrencyBudget:
+    """Лимит одновременно выполняемых запросов группы маршрутов с ограниченной очередью."""
+
+    def __init__(self, name, max_concurrency, max_queue, queue_timeout, request_timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.queue_timeout))
+
+    async def admit(self):
+        """Занимает слот; при отказе возвращает HTTP-статус для ответа клиенту."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            return status.HTTP_429_TOO_MANY_REQUESTS
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return status.HTTP_503_SERVICE_UNAVAILABLE
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+
+# bcrypt-маршруты получают отдельный небольшой бюджет, чтобы шторм логинов
+# не вытеснял дешевые чтения вроде /users/me
+PASSWORD_BUDGET = ConcurrencyBudget(
+    "password",
+    max_concurrency=int(os.getenv("ADMISSION_PASSWORD_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("ADMISSION_PASSWORD_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_PASSWORD_QUEUE_TIMEOUT", "1.0")),
+    request_timeout=float(os.getenv("ADMISSION_PASSWORD_REQUEST_TIMEOUT", "5.0")),
+)
+DEFAULT_BUDGET = ConcurrencyBudget(
+    "default",
+    max_concurrency=int(os.getenv("ADMISSION_DEFAULT_CONCURRENCY", "64")),
+    max_queue=int(os.getenv("ADMISSION_DEFAULT_QUEUE", "256")),
+    queue_timeout=float(os.getenv("ADMISSION_DEFAULT_QUEUE_TIMEOUT", "2.0")),
+    request_timeout=float(os.getenv("ADMISSION_DEFAULT_REQUEST_TIMEOUT", "10.0")),
+)
+
+ROUTE_BUDGETS = (
+    ("/auth/token", PASSWORD_BUDGET),
+    ("/auth/login", PASSWORD_BUDGET),
+    ("/auth/register", PASSWORD_BUDGET),
+)
+
+# Долгоживущие потоки и документация не занимают слоты и не получают дедлайн
+EXEMPT_PATHS = ("/users/changes", "/health", "/docs", "/redoc", "/openapi.json")
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware: бюджеты конкурентности по маршрутам и дедлайн запроса.
+
+    Запрос ждет свободный слот не дольше queue_timeout, иначе получает 503;
+    при переполненной очереди сразу отвечаем 429. Оставшееся до дедлайна время
+    передается в statement_timeout запросов к базе данных.
+    """
+
+    def __init__(self, app, route_budgets=ROUTE_BUDGETS, default_budget=DEFAULT_BUDGET, exempt_paths=EXEMPT_PATHS):
+        self.app = app
+        self.route_budgets = route_budgets
+        self.default_budget = default_budget
+        self.exempt_paths = exempt_paths
+
+    def _budget_for(self, path):
+        for prefix, budget in self.route_budgets:
+            if path.startswith(prefix):
+                return budget
+        return self.default_budget
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code, budget):
+        response = JSONResponse(
+            {"detail": "Сервис перегружен, повторите запрос позже"},
+            status_code=status_code,
+            headers={"Retry-After": str(budget.retry_after)},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        budget = self._budget_for(scope["path"])
+        deadline = time.monotonic() + budget.request_timeout
+
+        rejection = await budget.admit()
+        if rejection is not None:
+            await self._reject(scope, receive, send, rejection, budget)
+            return
+
+        token = statement_deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            statement_deadline.reset(token)
+            budget.release()
+
+
+def _has_body(scope):
+    headers = dict(scope["headers"])
+    return b"transfer-encoding" in headers or headers.get(b"content-length", b"0") not in (b"", b"0")
+
+
+class ClientDisconnectMiddleware:
+    """ASGI middleware: отмена обработки запроса, если клиент отключился до ответа.
+
+    После того как тело запроса прочитано, следующим сообщением от сервера может
+    быть только http.disconnect, поэтому его ожидание не мешает приложению.
+    Отмена задачи доходит до Database.execute_query_async, который отменяет
+    запрос на сервере БД и освобождает соединение.
+    """
+
+    def __init__(self, app, exempt_paths=EXEMPT_PATHS):
+        self.app = app
+        self.exempt_paths = exempt_paths
+        self.cancelled = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        body_read = asyncio.Event()
+        if not _has_body(scope):
+            body_read.set()
+        buffered = []
+        response_started = False
+        disconnected = False
+
+        async def receive_wrapper():
+            if buffered:
+                return buffered.pop(0)
+            message = await receive()
+            if message["type"] == "http.disconnect" or not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        async def watch_disconnect():
+            nonlocal disconnected
+            await body_read.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                # Пустое тело запроса без Content-Length: отдадим его приложению по требованию
+                buffered.append(message)
+
+            if not response_started:
+                disconnected = True
+                self.cancelled += 1
+                app_task.cancel()
+            buffered.append(message)
+
+        # Наблюдатель создается первым, чтобы забрать пустое тело до того, как его запросит приложение
+        watcher = asyncio.create_task(watch_disconnect())
+        app_task = asyncio.create_task(self.app(scope, receive_wrapper, send_wrapper))
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            watcher.cancel()
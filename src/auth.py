@@ -13,17 +13,35 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+INTROSPECTION_CACHE_SECONDS = int(os.getenv("INTROSPECTION_CACHE_SECONDS", "30"))
+
+# Права, которые роль пользователя получает в claim "scope" access token
+ROLE_SCOPES = {
+    "user": [],
+    "admin": ["admin:read", "admin:write", "auth:introspect", "users:changes"],
+    # Сервисы получают только чтение: проверку токенов и поток изменений для своих кешей
+    "service": ["auth:introspect", "users:changes"],
+}
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+def warm_up_hashing():
+    # Загрузка bcrypt-бэкенда passlib происходит при первом хешировании
+    pwd_context.hash("warm-up")
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
+def scopes_for_role(role: str) -> list[str]:
+    return ROLE_SCOPES.get(role, [])
+
+def create_access_token(data: dict, expires_delta: timedelta = None, scopes: list[str] = None):
     to_encode = data.copy()
+    if scopes is not None:
+        to_encode["scope"] = " ".join(scopes)
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
@@ -32,20 +50,24 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
+def try_decode_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return user_id
     except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+def decode_token(token: str) -> dict:
+    payload = try_decode_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+    return payload
+
+def verify_token(token: str):
+    return decode_token(token)["sub"]
\ No newline at end of file
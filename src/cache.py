@@ -0,0 +1,104 @@
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class UserCache:
+    """LRU-кеш строк пользователей в памяти воркера с ограничением по времени жизни.
+
+    Актуальность поддерживается инвалидацией при записи и уведомлениями
+    из users_changes; TTL ограничивает устаревание, если уведомления потеряны.
+
+    Читатель берет token() до запроса к БД и передает его в set(): строка не
+    попадет в кеш, если ключ инвалидирован, пока шел запрос, или если ее
+    updated_at старше версии из уведомления (чтение с отстающей реплики).
+    """
+
+    def __init__(self, max_size=10000, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+        # Ключ -> (номер инвалидации, минимальная допустимая версия строки)
+        self._invalidations = OrderedDict()
+        self._clock = 0
+        # Последний номер, вытесненный из _invalidations или сброшенный clear():
+        # токены старше него не принимаются, т.к. о пропущенных инвалидациях мы не знаем
+        self._forgotten_clock = 0
+
+    def get(self, user_id):
+        key = int(user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, row = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return row
+
+    def token(self):
+        return self._clock
+
+    def _is_stale(self, key, row, token):
+        if token < self._forgotten_clock:
+            return True
+
+        invalidation = self._invalidations.get(key)
+        if invalidation is None:
+            return False
+
+        invalidated_at, min_version = invalidation
+        if invalidated_at > token:
+            return True
+        version = row.get('updated_at') or row.get('created_at')
+        return min_version is not None and version is not None and version < min_version
+
+    def set(self, user_id, row, token):
+        if self.max_size <= 0:
+            return
+
+        key = int(user_id)
+        if self._is_stale(key, row, token):
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, row)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids, version=None):
+        """Удаляет строки; version (updated_at записи) запрещает кешировать более старые."""
+        self._clock += 1
+        for user_id in user_ids:
+            key = int(user_id)
+            self._entries.pop(key, None)
+
+            min_version = version
+            previous = self._invalidations.pop(key, None)
+            if previous is not None and previous[1] is not None:
+                min_version = previous[1] if version is None else max(previous[1], version)
+            self._invalidations[key] = (self._clock, min_version)
+
+        while len(self._invalidations) > max(self.max_size, 1):
+            _, (invalidated_at, _) = self._invalidations.popitem(last=False)
+            self._forgotten_clock = max(self._forgotten_clock, invalidated_at)
+
+    def clear(self):
+        self._clock += 1
+        self._entries.clear()
+        self._invalidations.clear()
+        self._forgotten_clock = self._clock
+
+
+user_cache = UserCache(
+    max_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
@@ -1,32 +1,189 @@
+import asyncio
+import functools
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar, copy_context
 
 import psycopg2
 from dotenv import load_dotenv
-from psycopg2.extras import RealDictCursor
+from psycopg2 import errors
+from psycopg2.extensions import connection as PgConnection
+from psycopg2.extensions import make_dsn
+from psycopg2.extras import RealDictCursor, execute_values
 
 load_dotenv()
 
+# Момент (time.monotonic()), к которому должен завершиться текущий HTTP-запрос;
+# выставляется AdmissionControlMiddleware и превращается в statement_timeout
+statement_deadline = ContextVar("statement_deadline", default=None)
+
+# Запрос, выполняемый из потока для execute_query_async; через него отменяем запрос на сервере
+_query_handle = ContextVar("query_handle", default=None)
+
+# Read-your-writes между воркерами и подами: момент (time.time()), до которого чтения
+# клиента идут в primary, и список записей текущего запроса. Выставляются
+# ReadYourWritesMiddleware из cookie/заголовка клиента
+client_pinned_until = ContextVar("client_pinned_until", default=None)
+request_writes = ContextVar("request_writes", default=None)
+
+# Отставание реплики в секундах. Если реплика получила весь WAL, отставание нулевое,
+# даже когда на primary давно не было транзакций и replay timestamp устарел
+REPLICA_LAG_QUERY = """
+    SELECT COALESCE(
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END,
+        0
+    )::float AS lag
+"""
+
+# Потоков для PQcancel на воркер: каждая отмена открывает к серверу отдельное соединение
+CANCEL_EXECUTOR_WORKERS = 2
+
+# После этих ошибок сервер гарантированно откатил транзакцию, поэтому повтор безопасен и для записи
+RETRYABLE_ERRORS = (errors.SerializationFailure, errors.DeadlockDetected)
+
+
+class QueryDeadlineExceeded(Exception):
+    pass
+
+
+# Запрос не уложился в таймаут или дедлайн: обработчики пробрасывают их дальше,
+# чтобы клиент получил 503 с Retry-After, а не 500
+TIMEOUT_ERRORS = (errors.QueryCanceled, QueryDeadlineExceeded)
+
+
+def _is_write(query):
+    return query.strip().lower().startswith(('insert', 'update', 'delete'))
+
+
+class _QueryHandle:
+    """Соединение, на котором сейчас выполняется запрос фонового потока."""
 
-class Database:
     def __init__(self):
+        self._lock = threading.Lock()
+        self.conn = None
+        self.cancelled = False
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryDeadlineExceeded("Запрос отменен до начала выполнения")
+            self.conn = conn
+
+    def detach(self):
+        with self._lock:
+            self.conn = None
+
+    def cancel(self):
+        # Под блокировкой: поток не отпустит соединение, пока идет отмена,
+        # и PQcancel не попадет в чужой запрос
+        with self._lock:
+            self.cancelled = True
+            if self.conn is not None and not self.conn.closed:
+                self.conn.cancel()
+
+
+class _Connection(PgConnection):
+    """Соединение psycopg2 с флагом: на нем мог остаться statement_timeout от прошлого запроса."""
+
+    statement_timeout_changed = False
+
+
+@contextmanager
+def _cancellable(conn):
+    handle = _query_handle.get()
+    if handle is None:
+        yield
+        return
+
+    handle.attach(conn)
+    try:
+        yield
+    finally:
+        handle.detach()
+
+
+class Database:
+    def __init__(self, primary_dsn=None, replica_dsns=None):
         self.connection = None
         self.max_retries = 5
         self.retry_delay = 2
 
+        # Значение по умолчанию для сессии; запросы с дедлайном сокращают его через SET
+        self.statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+        self.query_retries = int(os.getenv("DB_QUERY_RETRIES", "3"))
+        self.retry_base_delay = float(os.getenv("DB_RETRY_BASE_DELAY", "0.05"))
+        self.retry_max_delay = float(os.getenv("DB_RETRY_MAX_DELAY", "1.0"))
+
+        self.primary_dsn = primary_dsn or os.getenv("DB_DSN") or make_dsn(
+            host=os.getenv("DB_HOST"),
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            port=os.getenv("DB_PORT"),
+        )
+        if replica_dsns is None:
+            replica_dsns = [
+                dsn.strip()
+                for dsn in os.getenv("DB_REPLICA_DSNS", "").split(",")
+                if dsn.strip()
+            ]
+        self.replica_dsns = list(replica_dsns)
+        self.replica_connections = [None] * len(self.replica_dsns)
+        self.replica_ejected_until = [0.0] * len(self.replica_dsns)
+        self.replica_eject_seconds = float(os.getenv("DB_REPLICA_EJECT_SECONDS", "30"))
+        self._next_replica = 0
+
+        # Соединение psycopg2 обслуживает один запрос за раз: потоки execute_query_async
+        # ждут его не дольше оставшегося времени запроса
+        self._primary_lock = threading.Lock()
+        self._replica_locks = [threading.Lock() for _ in self.replica_dsns]
+        self._executor = None
+        # PQcancel ждет ответа сервера, поэтому выполняется в своем потоке: не в event loop
+        # и не в очереди основного исполнителя, где все потоки могут быть заняты
+        self._cancel_executor = None
+        # Проверка отставания реплик идет в собственном потоке: когда все потоки
+        # основного исполнителя заняты, она не ждет в очереди за запросами
+        self._lag_executor = None
+
+        # Ключ (обычно ID пользователя) -> момент, до которого чтения идут в primary
+        self.read_your_writes_seconds = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+        self._pinned_until = {}
+
+        # Окно pin покрывает запись, только пока реплика отстает меньше него,
+        # поэтому реплики с большим отставанием выводятся из ротации
+        self.replica_max_lag_seconds = float(
+            os.getenv("DB_REPLICA_MAX_LAG_SECONDS", str(self.read_your_writes_seconds))
+        )
+        self.replica_lag = [None] * len(self.replica_dsns)
+        self.replica_lagging = [False] * len(self.replica_dsns)
+
+    def open_connection(self, dsn):
+        return psycopg2.connect(
+            dsn,
+            connect_timeout=3,
+            options=f"-c statement_timeout={self.statement_timeout_ms}",
+            connection_factory=_Connection,
+        )
+
+    @staticmethod
+    def _backoff(attempt, base, cap):
+        # Экспоненциальная задержка с полным джиттером, чтобы воркеры не повторяли синхронно
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
     def connect(self):
-        if self.connection is None:
+        """Подключение при старте с повторами; вызывается из потока (lifespan), не из event loop."""
+        if self.connection is None or self.connection.closed:
             retries = 0
             while retries < self.max_retries:
                 try:
-                    self.connection = psycopg2.connect(
-                        host=os.getenv("DB_HOST"),
-                        database=os.getenv("DB_NAME"),
-                        user=os.getenv("DB_USER",),
-                        password=os.getenv("DB_PASSWORD"),
-                        port=os.getenv("DB_PORT"),
-                        connect_timeout=3
-                    )
+                    self.connection = self.open_connection(self.primary_dsn)
                     print("Подключение успешно!")
                     self._create_tables()
                     return self.connection
@@ -34,21 +191,22 @@ class Database:
                     retries += 1
                     print(f"Попытка {retries}/{self.max_retries}: {e}")
                     if retries < self.max_retries:
-                        time.sleep(self.retry_delay)
+                        time.sleep(self._backoff(retries, self.retry_delay, self.retry_delay * 4))
                     else:
                         raise e
         return self.connection
 
+    def _primary(self):
+        # В запросах переподключаемся одной попыткой: повторы с задержкой делает execute_query_async
+        if self.connection is None or self.connection.closed:
+            self.connection = self.open_connection(self.primary_dsn)
+        return self.connection
+
     def _create_tables(self):
         cursor = self.connection.cursor()
         try:
-            # Проверяем существование таблицы
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'users'
-                )
-            """)
+            # Проверяем существование таблицы по каталогу, без обхода information_schema
+            cursor.execute("SELECT to_regclass('users') IS NOT NULL")
             table_exists = cursor.fetchone()[0]
 
             if not table_exists:
@@ -62,12 +220,23 @@ class Database:
                         last_name VARCHAR(100) NOT NULL,
                         is_active BOOLEAN DEFAULT TRUE,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_login_at TIMESTAMP,
+                        last_seen_at TIMESTAMP,
+                        role VARCHAR(20) NOT NULL DEFAULT 'user'
                     )
                 """)
 
                 cursor.execute("CREATE INDEX idx_users_email ON users(email)")
-                cursor.execute("CREATE INDEX idx_users_is_active ON users(is_active)")
+                cursor.execute("CREATE INDEX idx_users_created_at ON users(created_at DESC)")
+                cursor.execute(
+                    "CREATE INDEX idx_users_inactive_created_at ON users(created_at DESC) "
+                    "WHERE is_active = FALSE"
+                )
+                cursor.execute(
+                    "CREATE INDEX idx_users_active_last_seen ON users(last_seen_at NULLS FIRST, id) "
+                    "WHERE is_active = TRUE"
+                )
 
                 self.connection.commit()
                 print("Таблицы созданы успешно")
@@ -80,22 +249,353 @@ class Database:
         finally:
             cursor.close()
 
+    def warm_up(self):
+        """Открывает соединения и проверяет их до того, как сервис станет ready."""
+        conn = self.connect()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.commit()
+
+        for index, dsn in enumerate(self.replica_dsns):
+            try:
+                replica = self.replica_connections[index]
+                if replica is None:
+                    replica = self.open_connection(dsn)
+                    replica.set_session(readonly=True, autocommit=True)
+                    self.replica_connections[index] = replica
+                with replica.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self._eject_replica(index, e)
+
     def disconnect(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        if self._cancel_executor is not None:
+            self._cancel_executor.shutdown(wait=True)
+            self._cancel_executor = None
+
+        if self._lag_executor is not None:
+            self._lag_executor.shutdown(wait=True)
+            self._lag_executor = None
+
         if self.connection:
             self.connection.close()
             self.connection = None
 
-    def execute_query(self, query, params=None):
-        conn = self.connect()
+        for index, conn in enumerate(self.replica_connections):
+            if conn is not None:
+                conn.close()
+                self.replica_connections[index] = None
+
+    def pin(self, *keys):
+        """Направляет чтения по ключам в primary, пока реплики догоняют запись.
+
+        Внутри HTTP-запроса запись также отмечается в request_writes, чтобы
+        ReadYourWritesMiddleware передал pin клиенту для других воркеров.
+        """
+        writes = request_writes.get()
+        if writes is not None and keys:
+            writes.append(time.time() + self.read_your_writes_seconds)
+
+        now = time.monotonic()
+        if len(self._pinned_until) > 10000:
+            self._pinned_until = {
+                key: until for key, until in self._pinned_until.items() if until > now
+            }
+
+        until = now + self.read_your_writes_seconds
+        for key in keys:
+            self._pinned_until[str(key)] = until
+
+    def is_pinned(self, key):
+        if key is None:
+            return False
+
+        client_until = client_pinned_until.get()
+        if client_until is not None and client_until > time.time():
+            return True
+
+        until = self._pinned_until.get(str(key))
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._pinned_until.pop(str(key), None)
+            return False
+        return True
+
+    def _replica_candidates(self):
+        count = len(self.replica_dsns)
+        for _ in range(count):
+            index = self._next_replica
+            self._next_replica = (self._next_replica + 1) % count
+
+            if self.replica_ejected_until[index] <= time.monotonic() and not self.replica_lagging[index]:
+                yield index
+
+    def check_replica_lag(self, index):
+        """Измеряет отставание реплики и выводит ее из ротации, если оно больше допустимого."""
+        if self.replica_ejected_until[index] > time.monotonic():
+            return None
+
+        deadline = time.monotonic() + 1.0
+        with self._holding(self._replica_locks[index], deadline):
+            conn = self._replica_connection(index)
+            if conn is None:
+                return None
+            try:
+                lag = self._run(conn, REPLICA_LAG_QUERY, None, deadline)[0]['lag']
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if not conn.closed:
+                    raise e
+                self._eject_replica(index, e)
+                return None
+
+        lagging = lag > self.replica_max_lag_seconds
+        if lagging != self.replica_lagging[index]:
+            state = "выведена из ротации" if lagging else "возвращена в ротацию"
+            print(f"Реплика {index} {state}: отставание {lag:.1f} с")
+        self.replica_lag[index] = lag
+        self.replica_lagging[index] = lagging
+        return lag
+
+    async def check_replicas_async(self):
+        if self._lag_executor is None:
+            self._lag_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-lag")
+
+        loop = asyncio.get_running_loop()
+        for index in range(len(self.replica_dsns)):
+            try:
+                await loop.run_in_executor(self._lag_executor, self.check_replica_lag, index)
+            except (psycopg2.Error, QueryDeadlineExceeded) as e:
+                # Реплика, которую не удалось проверить, не должна обслуживать чтения
+                self.replica_lagging[index] = True
+                print(f"Не удалось проверить отставание реплики {index}: {e}")
+
+    def _replica_connection(self, index):
+        conn = self.replica_connections[index]
+        if conn is None:
+            try:
+                conn = self.open_connection(self.replica_dsns[index])
+                conn.set_session(readonly=True, autocommit=True)
+            except psycopg2.OperationalError as e:
+                self._eject_replica(index, e)
+                return None
+            self.replica_connections[index] = conn
+        return conn
+
+    def _eject_replica(self, index, error):
+        print(f"Реплика {index} исключена на {self.replica_eject_seconds} с: {error}")
+        self.replica_ejected_until[index] = time.monotonic() + self.replica_eject_seconds
+
+        conn = self.replica_connections[index]
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+            self.replica_connections[index] = None
+
+    @staticmethod
+    def _deadline(timeout=None):
+        """Ближайший из дедлайна HTTP-запроса и собственного таймаута запроса (в секундах)."""
+        deadline = statement_deadline.get()
+        if timeout is not None:
+            query_deadline = time.monotonic() + timeout
+            deadline = query_deadline if deadline is None else min(deadline, query_deadline)
+        return deadline
+
+    @contextmanager
+    def _holding(self, lock, deadline):
+        # Запросы не копятся в очереди к соединению дольше, чем им позволено выполняться
+        if deadline is None:
+            wait = self.statement_timeout_ms / 1000
+        else:
+            wait = max(0.0, deadline - time.monotonic())
+
+        if not lock.acquire(timeout=wait):
+            raise QueryDeadlineExceeded("Соединение с БД занято дольше допустимого")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def execute_query(self, query, params=None, read_only=False, pin_key=None, timeout=None, write=None):
+        # write=True нужен запросам, которые меняют данные, но не начинаются с INSERT/UPDATE/DELETE
+        # (например, SELECT функции с DDL): они коммитятся так же, как записи
+        write = _is_write(query) if write is None else write
+        deadline = self._deadline(timeout)
+
+        if read_only and self.replica_dsns and not self.is_pinned(pin_key):
+            for index in self._replica_candidates():
+                with self._holding(self._replica_locks[index], deadline):
+                    conn = self._replica_connection(index)
+                    if conn is None:
+                        continue
+                    try:
+                        return self._run(conn, query, params, deadline)
+                    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                        # Ошибки самого запроса пробрасываем, при потере соединения
+                        # исключаем реплику и повторяем чтение в primary
+                        if not conn.closed:
+                            raise e
+                        self._eject_replica(index, e)
+                        break
+
+        with self._holding(self._primary_lock, deadline):
+            result = self._run(self._primary(), query, params, deadline, write)
+        if pin_key is not None and write:
+            self.pin(pin_key)
+        return result
+
+    async def execute_query_async(self, query, params=None, read_only=False, pin_key=None, timeout=None,
+                                  write=None):
+        """execute_query в отдельном потоке, не блокируя event loop.
+
+        Отмена задачи (клиент отключился, остановка сервиса) отменяет запрос
+        на сервере. Чтения повторяются при ошибках сериализации, дедлоках и
+        потере соединения, записи - только при первых двух.
+        """
+        return await self._retrying(
+            self.execute_query,
+            query,
+            params,
+            read_only=read_only,
+            pin_key=pin_key,
+            timeout=timeout,
+            write=write,
+            idempotent=not (_is_write(query) if write is None else write),
+        )
+
+    async def execute_values_async(self, query, rows, template=None, page_size=1000, timeout=None,
+                                   idempotent=False):
+        """execute_values в отдельном потоке; idempotent разрешает повтор после потери соединения."""
+        return await self._retrying(
+            self.execute_values,
+            query,
+            rows,
+            template=template,
+            page_size=page_size,
+            timeout=timeout,
+            idempotent=idempotent,
+        )
+
+    @staticmethod
+    def _is_transient(error, idempotent):
+        if isinstance(error, RETRYABLE_ERRORS):
+            return True
+        # При потере соединения запись могла успеть зафиксироваться, поэтому повторяем только
+        # идемпотентные запросы; QueryCanceled - это таймаут, его повтор только добавит нагрузки
+        return (
+            idempotent
+            and isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            and not isinstance(error, errors.QueryCanceled)
+        )
+
+    async def _retrying(self, func, *args, idempotent, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await self._in_thread(func, *args, **kwargs)
+            except Exception as e:
+                if attempt >= self.query_retries or not self._is_transient(e, idempotent):
+                    raise e
+
+                delay = self._backoff(attempt, self.retry_base_delay, self.retry_max_delay)
+                deadline = statement_deadline.get()
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise e
+
+                attempt += 1
+                print(f"Повтор запроса {attempt}/{self.query_retries} через {delay:.3f} с: {e}")
+                await asyncio.sleep(delay)
+
+    async def _in_thread(self, func, *args, **kwargs):
+        if self._executor is None:
+            # Потоков не больше, чем соединений: лишние запросы ждут в очереди исполнителя
+            self._executor = ThreadPoolExecutor(
+                max_workers=1 + len(self.replica_dsns),
+                thread_name_prefix="db",
+            )
+
+        handle = _QueryHandle()
+        context = copy_context()
+        context.run(_query_handle.set, handle)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._cancel_executor is None:
+                self._cancel_executor = ThreadPoolExecutor(
+                    max_workers=CANCEL_EXECUTOR_WORKERS, thread_name_prefix="db-cancel"
+                )
+
+            # Останавливаем запрос на сервере и ждем, пока поток откатит транзакцию
+            # и освободит соединение, иначе оно останется занятым брошенным запросом
+            with suppress(Exception):
+                await asyncio.shield(loop.run_in_executor(self._cancel_executor, handle.cancel))
+            with suppress(Exception):
+                await asyncio.shield(future)
+            raise
+
+    def _statement_timeout_prefix(self, conn, deadline):
+        if deadline is not None:
+            timeout_ms = int((deadline - time.monotonic()) * 1000)
+            if timeout_ms <= 0:
+                raise QueryDeadlineExceeded("Истекло время обработки запроса")
+            conn.statement_timeout_changed = True
+            return f"SET statement_timeout = {timeout_ms}; "
+
+        if conn.statement_timeout_changed:
+            conn.statement_timeout_changed = False
+            return "SET statement_timeout = DEFAULT; "
+
+        return ""
+
+    def execute_values(self, query, rows, template=None, page_size=1000, timeout=None):
+        """Многострочная вставка/обновление через psycopg2.extras.execute_values в primary."""
+        deadline = self._deadline(timeout)
+        with self._holding(self._primary_lock, deadline):
+            conn = self._primary()
+            cursor = conn.cursor()
+            try:
+                timeout_prefix = self._statement_timeout_prefix(conn, deadline)
+                if timeout_prefix:
+                    cursor.execute(timeout_prefix)
+                with _cancellable(conn):
+                    execute_values(cursor, query, rows, template=template, page_size=page_size)
+                conn.commit()
+            except Exception as e:
+                # Откат мог вернуть прежний statement_timeout, сбросим его при следующем запросе
+                conn.statement_timeout_changed = True
+                if not conn.closed:
+                    conn.rollback()
+                raise e
+            finally:
+                cursor.close()
+
+    def _run(self, conn, query, params, deadline=None, write=None):
+        timeout_prefix = self._statement_timeout_prefix(conn, deadline)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         try:
-            cursor.execute(query, params)
-            if query.strip().lower().startswith(('insert', 'update', 'delete')):
+            # SET и сам запрос уходят на сервер одним обращением
+            with _cancellable(conn):
+                cursor.execute(timeout_prefix + query, params)
+            if _is_write(query) if write is None else write:
                 conn.commit()
             result = cursor.fetchall() if cursor.description else None
             return result
         except Exception as e:
-            conn.rollback()
+            # Откат мог вернуть прежний statement_timeout, сбросим его при следующем запросе
+            conn.statement_timeout_changed = True
+            if not conn.closed:
+                conn.rollback()
             raise e
         finally:
             cursor.close()
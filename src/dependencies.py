@@ -1,18 +1,77 @@
-from fastapi import HTTPException, status
+import time
+from typing import Optional
 
-from src.auth import verify_token
-from src.database import db
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from src.activity import activity_tracker
+from src.auth import decode_token
+from src.cache import user_cache
+from src.database import db, statement_deadline
+from src.queries import USER_BY_ID_QUERY
 
-async def get_current_user(token: str):
-    user_id = verify_token(token)
+bearer_scheme = HTTPBearer(auto_error=False)
 
-    query = """
-        SELECT id, email, first_name, last_name, is_active, created_at 
-        FROM users 
-        WHERE id = %s
-    """
-    user = db.execute_query(query, (user_id,))
+
+async def get_token_claims(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+):
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return decode_token(credentials.credentials)
+
+
+def route_timeout(seconds: float):
+    """Сокращает дедлайн запросов к БД для маршрута; дедлайн admission не продлевается."""
+
+    async def limit_deadline():
+        deadline = time.monotonic() + seconds
+        current = statement_deadline.get()
+        token = statement_deadline.set(deadline if current is None else min(current, deadline))
+        try:
+            yield
+        finally:
+            statement_deadline.reset(token)
+
+    return limit_deadline
+
+
+def require_scope(*scopes: str):
+    """Проверяет права только по claim "scope" подписанного токена, без запросов к БД."""
+
+    async def check_scope(claims: dict = Depends(get_token_claims)):
+        granted = set(claims.get("scope", "").split())
+        missing = [scope for scope in scopes if scope not in granted]
+
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Недостаточно прав",
+                headers={
+                    "WWW-Authenticate": f'Bearer error="insufficient_scope", scope="{" ".join(scopes)}"'
+                },
+            )
+
+        return claims
+
+    return check_scope
+
+
+async def get_current_user(claims: dict = Depends(get_token_claims)):
+    user_id = claims["sub"]
+
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        activity_tracker.record_seen(cached_user['id'])
+        return cached_user
+
+    cache_token = user_cache.token()
+    user = await db.execute_query_async(USER_BY_ID_QUERY, (user_id,), read_only=True, pin_key=user_id)
 
     if not user:
         raise HTTPException(
@@ -21,4 +80,7 @@ async def get_current_user(token: str):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    user_cache.set(user_id, user[0], cache_token)
+    activity_tracker.record_seen(user[0]['id'])
+
     return user[0]
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+from psycopg2.extras import Json
+
+from src.database import db
+from src.queries import (
+    CREATE_PARTITION_QUERY,
+    INSERT_EVENTS_QUERY,
+    INSERT_EVENTS_TEMPLATE,
+    PARTITION_EXISTS_QUERY,
+)
+
+load_dotenv()
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class AuthEventLog:
+    """Журнал событий аутентификации с асинхронной пакетной записью.
+
+    Обработчики только кладут событие в ограниченную очередь в памяти,
+    фоновая задача сбрасывает ее в auth_events многострочными INSERT.
+    При переполнении очереди новые события отбрасываются и учитываются в dropped.
+
+    Месячные партиции auth_events создаются заранее на partitions_ahead месяцев
+    при старте и при смене месяца: партиция по умолчанию должна оставаться пустой,
+    иначе Postgres не даст создать партицию за месяц, строки которого в ней лежат.
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=1.0, partitions_ahead=2):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.partitions_ahead = partitions_ahead
+        self._partitions_month = None
+        self._partitions_retry_at = 0.0
+
+        self._pending = deque()
+        self._batch_ready = asyncio.Event()
+        self._task = None
+
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, event_type, user_id=None, actor_id=None, email=None, ip_address=None, **details):
+        if len(self._pending) >= self.max_queue_size:
+            self.dropped += 1
+            return
+
+        self._pending.append((
+            datetime.utcnow(),
+            event_type,
+            user_id,
+            actor_id,
+            email,
+            ip_address,
+            Json(details) if details else None,
+        ))
+        self.recorded += 1
+
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self):
+        while self._pending:
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+
+            started = time.perf_counter()
+            try:
+                await db.execute_values_async(
+                    INSERT_EVENTS_QUERY, batch, template=INSERT_EVENTS_TEMPLATE, page_size=self.batch_size
+                )
+            except asyncio.CancelledError:
+                # Остановка во время записи: пакет вернется в очередь и будет записан в stop()
+                self._pending.extendleft(reversed(batch))
+                raise
+            except Exception as e:
+                # Пакет не возвращаем в очередь, чтобы недоступная БД не раздувала память
+                self.failed += len(batch)
+                print(f"Ошибка при записи событий аутентификации: {e}")
+                return
+            finally:
+                self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+            self.written += len(batch)
+            self.batches += 1
+
+    async def ensure_partitions(self):
+        month = datetime.utcnow().date().replace(day=1)
+        if month == self._partitions_month or time.monotonic() < self._partitions_retry_at:
+            return
+
+        try:
+            for offset in range(self.partitions_ahead + 1):
+                partition_month = _add_months(month, offset)
+                name = f"auth_events_{partition_month:%Y_%m}"
+                exists = await db.execute_query_async(PARTITION_EXISTS_QUERY, (name,))
+                if not exists[0]['exists']:
+                    # Воркеры могут создавать партицию одновременно: CREATE TABLE IF NOT EXISTS
+                    # в функции не гарантирует отсутствия гонки, ошибка повторится позже
+                    await db.execute_query_async(CREATE_PARTITION_QUERY, (partition_month,), write=True)
+                    print(f"Создана партиция {name}")
+        except Exception as e:
+            self._partitions_retry_at = time.monotonic() + 60
+            print(f"Ошибка при создании партиций auth_events: {e}")
+            return
+
+        self._partitions_month = month
+
+    async def _run(self):
+        while True:
+            await self.ensure_partitions()
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "queued": len(self._pending),
+            "max_queue_size": self.max_queue_size,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+
+auth_events = AuthEventLog(
+    max_queue_size=int(os.getenv("AUTH_EVENTS_MAX_QUEUE", "10000")),
+    batch_size=int(os.getenv("AUTH_EVENTS_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUTH_EVENTS_FLUSH_INTERVAL", "1.0")),
+    partitions_ahead=int(os.getenv("AUTH_EVENTS_PARTITIONS_AHEAD", "2")),
+)
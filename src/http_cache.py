@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+# Клиент может хранить ответ, но обязан перепроверять его через If-None-Match
+USER_CACHE_CONTROL = "private, no-cache"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def user_etag(user_id: int, updated_at: datetime) -> str:
+    # updated_at меняется триггером при каждом изменении полей ответа
+    version = (updated_at.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+    return f'"{user_id}-{version:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def _not_modified_since(if_modified_since: str, updated_at: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+    return modified <= since
+
+
+def row_version(row) -> datetime:
+    return row.get("updated_at") or row["created_at"]
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def conditional_get(
+        request: Request,
+        response: Response,
+        user_id: int,
+        updated_at: datetime,
+) -> Optional[Response]:
+    """Выставляет ETag/Last-Modified и возвращает 304, если версия клиента актуальна."""
+    etag = user_etag(user_id, updated_at)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": USER_CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    elif if_modified_since is not None:
+        not_modified = _not_modified_since(if_modified_since, updated_at)
+    else:
+        not_modified = False
+
+    if not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+
+from src.cache import user_cache
+from src.database import db
+
+load_dotenv()
+
+USERS_CHANGES_CHANNEL = "users_changes"
+
+
+class UserChangeFeed:
+    """Слушатель LISTEN users_changes: одно соединение на воркер.
+
+    Каждое уведомление закрепляет чтения пользователя за primary на окно
+    read-your-writes, инвалидирует user_cache и рассылается подписчикам
+    потока изменений. Подписчик, не успевающий читать, получает None
+    (сигнал пересинхронизации) и отключается.
+    """
+
+    def __init__(self, channel=USERS_CHANGES_CHANNEL, subscriber_queue_size=1000, reconnect_delay=2.0):
+        self.channel = channel
+        self.subscriber_queue_size = subscriber_queue_size
+        self.reconnect_delay = reconnect_delay
+
+        self._subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def _disconnect(self, queue):
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        self.unsubscribe(queue)
+
+    def _dispatch(self, payload):
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            print(f"Некорректное уведомление {self.channel}: {payload}")
+            return
+
+        # Запись могла прийти через другой воркер или под: пока реплики ее догоняют,
+        # чтения этого пользователя и в этом воркере идут в primary
+        db.pin(change['id'])
+        # Версия из уведомления не дает закешировать строку, прочитанную до этой записи
+        version = datetime.fromisoformat(change['updated_at']) if change.get('updated_at') else None
+        user_cache.invalidate(change['id'], version=version)
+
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(change)
+            except asyncio.QueueFull:
+                self._disconnect(queue)
+
+    async def _listen(self, conn):
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(conn.fileno(), readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            loop.remove_reader(conn.fileno())
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = db.open_connection(db.primary_dsn)
+                conn.set_session(autocommit=True)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+
+                # Уведомления, пришедшие пока слушателя не было, потеряны
+                user_cache.clear()
+                await self._listen(conn)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Слушатель {self.channel} отключен: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for queue in list(self._subscribers):
+            self._disconnect(queue)
+
+
+user_change_feed = UserChangeFeed(
+    subscriber_queue_size=int(os.getenv("USER_CHANGES_QUEUE_SIZE", "1000")),
+)
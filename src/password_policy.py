@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MIN_PASSWORD_LENGTH = 8
+
+PASSWORD_CHECKS = (
+    (re.compile(r'[A-Z]'), 'заглавную букву'),
+    (re.compile(r'[a-z]'), 'строчную букву'),
+    (re.compile(r'[0-9]'), 'цифру'),
+    (re.compile(r'[!@#$%^&*(),.?":{}|<>]'), 'специальный символ'),
+)
+
+# Заголовок файла фильтра: сигнатура, размер битового массива, число хеш-функций, число элементов
+BLOOM_MAGIC = b"BPF1"
+BLOOM_HEADER = struct.Struct("<4sQIQ")
+
+
+class BreachedPasswordFilter:
+    """Фильтр Блума по SHA-1 утекших паролей, отображенный в память.
+
+    Файл открывается через mmap только для чтения, поэтому все воркеры
+    разделяют одни и те же страницы page cache.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.num_bits, self.num_hashes, self.num_items = BLOOM_HEADER.unpack_from(self._mmap)
+        if magic != BLOOM_MAGIC:
+            raise ValueError(f"Файл {path} не является фильтром утекших паролей")
+        if len(self._mmap) < BLOOM_HEADER.size + (self.num_bits + 7) // 8:
+            raise ValueError(f"Файл фильтра {path} поврежден")
+
+    def contains_digest(self, digest: bytes) -> bool:
+        data = self._mmap
+        offset = BLOOM_HEADER.size
+        # all() останавливается на первом нулевом бите: большинство отсутствующих
+        # паролей отсекается на первых пробах
+        return all(
+            data[offset + (position >> 3)] & (1 << (position & 7))
+            for position in _bit_positions(digest, self.num_bits, self.num_hashes)
+        )
+
+    def __contains__(self, password: str) -> bool:
+        return self.contains_digest(hashlib.sha1(password.encode("utf-8")).digest())
+
+    def close(self):
+        self._mmap.close()
+
+
+def _bit_positions(digest: bytes, num_bits: int, num_hashes: int):
+    # Двойное хеширование поверх уже равномерно распределенного SHA-1;
+    # единственная реализация схемы и для сборки, и для проверки
+    h1 = int.from_bytes(digest[0:8], "little")
+    h2 = int.from_bytes(digest[8:16], "little") | 1
+    for i in range(num_hashes):
+        yield (h1 + i * h2) % num_bits
+
+
+@lru_cache(maxsize=None)
+def get_breached_filter():
+    """Фильтр из BREACHED_PASSWORDS_FILTER; None, если переменная не задана.
+
+    Вызывается при прогреве (warm_up_process), поэтому недоступный или
+    поврежденный файл останавливает запуск, а не превращается в 500 при регистрации.
+    """
+    path = os.getenv("BREACHED_PASSWORDS_FILTER")
+    if not path:
+        return None
+    try:
+        return BreachedPasswordFilter(path)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"BREACHED_PASSWORDS_FILTER: не удалось открыть фильтр: {e}") from e
+
+
+def validate_password(password: str) -> str:
+    if len(password) < MIN_PASSWORD_LENGTH:
+        raise ValueError(f'Пароль должен содержать минимум {MIN_PASSWORD_LENGTH} символов')
+
+    for pattern, requirement in PASSWORD_CHECKS:
+        if not pattern.search(password):
+            raise ValueError(f'Пароль должен содержать хотя бы одну {requirement}')
+
+    breached_filter = get_breached_filter()
+    if breached_filter is not None and password in breached_filter:
+        raise ValueError('Пароль найден в базе утекших паролей, выберите другой')
+
+    return password
+
+
+def _iter_digests(source: str):
+    # Формат строк как в списках Have I Been Pwned: "SHA1HEX" или "SHA1HEX:count"
+    with open(source, "r", encoding="ascii") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield bytes.fromhex(line.split(":", 1)[0])
+
+
+def build_filter(source: str, target: str, false_positive_rate: float = 0.001) -> int:
+    num_items = sum(1 for _ in _iter_digests(source))
+    num_bits = max(8, math.ceil(-num_items * math.log(false_positive_rate) / math.log(2) ** 2))
+    num_hashes = max(1, round(num_bits / max(num_items, 1) * math.log(2)))
+
+    bits = bytearray((num_bits + 7) // 8)
+    for digest in _iter_digests(source):
+        for position in _bit_positions(digest, num_bits, num_hashes):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    tmp_target = f"{target}.tmp"
+    with open(tmp_target, "wb") as f:
+        f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, num_bits, num_hashes, num_items))
+        f.write(bits)
+    os.replace(tmp_target, target)
+
+    return num_items
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Сборка фильтра Блума утекших паролей из списка SHA-1 хешей"
+    )
+    parser.add_argument("source", help="Файл со строками SHA1HEX[:count]")
+    parser.add_argument("target", help="Путь к собираемому файлу фильтра")
+    parser.add_argument(
+        "--fp-rate",
+        type=float,
+        default=0.001,
+        help="Допустимая доля ложноположительных срабатываний",
+    )
+    args = parser.parse_args()
+
+    count = build_filter(args.source, args.target, args.fp_rate)
+    print(f"Фильтр собран: {count} хешей -> {args.target}")
@@ -0,0 +1,231 @@
+"""SQL-запросы сервиса.
+
+Роутеры, зависимости и фоновые задачи берут запросы отсюда, а
+scripts/check_query_plans.py проверяет планы именно этих запросов: новый
+запрос нужно добавить сюда и в реестр скрипта, иначе проверка завершится ошибкой.
+Запросы с переменной частью собираются функциями *_query из фиксированных фрагментов.
+"""
+
+USER_COLUMNS = "id, email, first_name, last_name, is_active, created_at, updated_at"
+LIST_COLUMNS = "id, email, first_name, last_name, is_active, created_at"
+
+# Пользователи
+
+USER_BY_ID_QUERY = f"""
+    SELECT {USER_COLUMNS}
+    FROM users
+    WHERE id = %s
+"""
+
+# Легкая проверка версии для условных GET
+USER_VERSION_BY_ID_QUERY = """
+    SELECT COALESCE(updated_at, created_at) AS updated_at
+    FROM users
+    WHERE id = %s
+"""
+
+USER_PAGE_QUERY = f"""
+    SELECT {LIST_COLUMNS}
+    FROM users
+    ORDER BY created_at DESC
+    LIMIT %s OFFSET %s
+"""
+
+USER_COUNT_QUERY = "SELECT COUNT(*) FROM users"
+
+# Оценка планировщика по статистике ANALYZE; до первого ANALYZE reltuples равен -1
+USER_COUNT_ESTIMATE_QUERY = """
+    SELECT GREATEST(reltuples, 0)::bigint AS count
+    FROM pg_class
+    WHERE oid = 'users'::regclass
+"""
+
+# Поиск ранжирует не больше стольких ближайших совпадений: глубже курсор не заходит
+SEARCH_CANDIDATE_LIMIT = 500
+
+# Текст поиска; выражение должно совпадать с индексом idx_users_search_trgm
+SEARCH_TEXT = "(email || ' ' || first_name || ' ' || last_name)"
+
+# Кандидаты - не больше %(candidates)s ближайших по word similarity строк: GiST-индекс
+# pg_trgm отдает их в порядке расстояния <<->, поэтому страница стоит O(candidates),
+# а не O(всех совпадений). Без второго ключа сортировки: при тысячах строк с равным
+# расстоянием он превращает KNN-обход в сортировку всех совпадений. Ранжирование и
+# курсор применяются только к кандидатам, совпадение по префиксу поднимает результат
+# выше нечеткого
+_SEARCH_USERS_TEMPLATE = f"""
+    SELECT id, email, first_name, last_name, is_active, created_at, rank
+    FROM (
+        SELECT id, email, first_name, last_name, is_active, created_at,
+               ROUND((
+                   GREATEST(
+                       word_similarity(%(q)s, email),
+                       word_similarity(%(q)s, first_name),
+                       word_similarity(%(q)s, last_name)
+                   )
+                   + CASE WHEN email ILIKE %(prefix)s
+                            OR first_name ILIKE %(prefix)s
+                            OR last_name ILIKE %(prefix)s
+                          THEN 1 ELSE 0 END
+               )::numeric, 6) AS rank
+        FROM (
+            SELECT id, email, first_name, last_name, is_active, created_at
+            FROM users
+            WHERE %(q)s <%% {SEARCH_TEXT}
+            ORDER BY %(q)s <<-> {SEARCH_TEXT}
+            LIMIT %(candidates)s
+        ) AS candidates
+    ) AS matches
+    {{cursor_condition}}
+    ORDER BY rank DESC, id
+    LIMIT %(limit)s
+"""
+
+SEARCH_USERS_QUERY = _SEARCH_USERS_TEMPLATE.format(cursor_condition="")
+
+SEARCH_USERS_AFTER_CURSOR_QUERY = _SEARCH_USERS_TEMPLATE.format(cursor_condition="""
+    WHERE rank < %(cursor_rank)s
+       OR (rank = %(cursor_rank)s AND id > %(cursor_id)s)
+""")
+
+# Аутентификация
+
+USER_ID_BY_EMAIL_QUERY = "SELECT id FROM users WHERE email = %s"
+
+USER_CREDENTIALS_BY_EMAIL_QUERY = "SELECT id, email, password_hash, is_active, role FROM users WHERE email = %s"
+
+INSERT_USER_QUERY = """
+    INSERT INTO users (email, password_hash, first_name, last_name, is_active)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id, email, first_name, last_name, is_active, created_at
+"""
+
+USER_STATUSES_BY_IDS_QUERY = "SELECT id, is_active FROM users WHERE id = ANY(%s)"
+
+# Профиль
+
+PROFILE_COLUMNS = ("first_name", "last_name", "is_active")
+
+
+def update_profile_query(columns):
+    """UPDATE профиля по подмножеству PROFILE_COLUMNS; значения - в том же порядке, затем id."""
+    unknown = set(columns) - set(PROFILE_COLUMNS)
+    if not columns or unknown:
+        raise ValueError(f"Недопустимые поля профиля: {sorted(unknown) or 'пусто'}")
+
+    assignments = ", ".join(f"{column} = %s" for column in columns)
+    return f"""
+        UPDATE users
+        SET {assignments}, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        RETURNING {USER_COLUMNS}
+    """
+
+
+DEACTIVATE_USER_QUERY = "UPDATE users SET is_active = FALSE WHERE id = %s RETURNING id"
+
+# Администрирование
+
+USER_STATUS_BY_ID_QUERY = """
+    SELECT id, email, is_active
+    FROM users
+    WHERE id = %s
+"""
+
+SET_USER_STATUS_QUERY = """
+    UPDATE users
+    SET is_active = %s
+    WHERE id = %s
+    RETURNING id, email, is_active
+"""
+
+INACTIVE_USERS_QUERY = f"""
+    SELECT {LIST_COLUMNS}
+    FROM users
+    WHERE is_active = FALSE
+    ORDER BY created_at DESC
+"""
+
+# Без индекса по last_seen_at: Seq Scan и top-N сортировка, зато отметки активности
+# обновляются как HOT (см. migrations/init.sql)
+DORMANT_USERS_QUERY = f"""
+    SELECT {LIST_COLUMNS}, last_login_at, last_seen_at
+    FROM users
+    WHERE is_active = TRUE
+      AND (last_seen_at < %s OR last_seen_at IS NULL)
+    ORDER BY last_seen_at NULLS FIRST, id
+    LIMIT %s
+"""
+
+BULK_CREATED_BEFORE_CONDITION = "created_at < %s"
+BULK_EMAIL_DOMAIN_CONDITION = "email ILIKE %s"
+
+
+def bulk_status_filters(created_before=None, email_domain=None):
+    """Условия и параметры фильтров массового изменения статуса."""
+    conditions = []
+    params = []
+
+    if created_before is not None:
+        conditions.append(BULK_CREATED_BEFORE_CONDITION)
+        params.append(created_before)
+
+    if email_domain is not None:
+        conditions.append(BULK_EMAIL_DOMAIN_CONDITION)
+        params.append(f"%@{email_domain}")
+
+    return conditions, params
+
+
+def bulk_status_by_ids_query(conditions):
+    """Параметры: is_active, список id, затем параметры условий."""
+    where = " AND ".join(["id = ANY(%s)"] + list(conditions))
+    return f"""
+        UPDATE users
+        SET is_active = %s
+        WHERE {where}
+        RETURNING id
+    """
+
+
+def bulk_status_by_filters_query(conditions):
+    """Порция строк со статусом, отличным от нового.
+
+    Параметры: is_active, is_active, параметры условий, размер порции.
+    Без SKIP LOCKED: строки, занятые другой транзакцией, ждут ее завершения
+    (не дольше дедлайна запроса), а не пропускаются молча.
+    """
+    where = " AND ".join(["is_active IS DISTINCT FROM %s"] + list(conditions))
+    return f"""
+        UPDATE users
+        SET is_active = %s
+        WHERE id IN (
+            SELECT id
+            FROM users
+            WHERE {where}
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE
+        )
+        RETURNING id
+    """
+
+
+# Фоновые задачи
+
+UPDATE_ACTIVITY_QUERY = """
+    UPDATE users AS u
+    SET last_login_at = GREATEST(u.last_login_at, v.last_login_at),
+        last_seen_at = GREATEST(u.last_seen_at, v.last_seen_at)
+    FROM (VALUES %s) AS v(id, last_login_at, last_seen_at)
+    WHERE u.id = v.id
+"""
+UPDATE_ACTIVITY_TEMPLATE = "(%s, %s::timestamp, %s::timestamp)"
+
+INSERT_EVENTS_QUERY = """
+    INSERT INTO auth_events (created_at, event_type, user_id, actor_id, email, ip_address, details)
+    VALUES %s
+"""
+INSERT_EVENTS_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s)"
+
+PARTITION_EXISTS_QUERY = "SELECT to_regclass(%s) IS NOT NULL AS exists"
+CREATE_PARTITION_QUERY = "SELECT create_auth_events_partition(%s)"
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import hmac
+import math
+import os
+import time
+from http.cookies import SimpleCookie
+
+from dotenv import load_dotenv
+
+from src.auth import SECRET_KEY
+from src.database import client_pinned_until, db, request_writes
+
+load_dotenv()
+
+READ_YOUR_WRITES_COOKIE = "rw_pin_until"
+READ_YOUR_WRITES_HEADER = "x-read-your-writes-until"
+
+
+class ReplicaLagMonitor:
+    """Фоновая проверка отставания реплик: отстающие дольше окна pin не обслуживают чтения."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await db.check_replicas_async()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and db.replica_dsns:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _pin_signature(until):
+    message = f"read-your-writes:{until}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_pin(until):
+    """Значение cookie/заголовка: момент окончания pin и его HMAC-подпись."""
+    value = f"{until:.3f}"
+    return f"{value}:{_pin_signature(value)}"
+
+
+def _client_pin(scope):
+    headers = dict(scope["headers"])
+    value = headers.get(READ_YOUR_WRITES_HEADER.encode())
+    if value is None and b"cookie" in headers:
+        cookie = SimpleCookie()
+        cookie.load(headers[b"cookie"].decode("latin-1"))
+        if READ_YOUR_WRITES_COOKIE in cookie:
+            value = cookie[READ_YOUR_WRITES_COOKIE].value.encode()
+
+    if value is None:
+        return None
+
+    # Без подписи сервера клиент мог бы сам закрепить свои чтения за primary
+    until_value, _, signature = value.decode("latin-1").partition(":")
+    if not hmac.compare_digest(signature, _pin_signature(until_value)):
+        return None
+    try:
+        until = float(until_value)
+    except ValueError:
+        return None
+
+    # Клиент не может закрепить свои чтения за primary дольше одного окна
+    return min(until, time.time() + db.read_your_writes_seconds)
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware: pin после записи передается клиенту, а не хранится в воркере.
+
+    Ответ на запрос с записью получает cookie и заголовок с моментом, до которого
+    чтения этого клиента идут в primary, подписанным SECRET_KEY. Следующий запрос может попасть в другой
+    воркер или под, но по cookie/заголовку все равно прочитает свою запись.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not db.replica_dsns:
+            await self.app(scope, receive, send)
+            return
+
+        writes = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and writes:
+                until = max(writes)
+                max_age = math.ceil(until - time.time())
+                pin = sign_pin(until)
+                headers = list(message.get("headers", []))
+                headers.append((READ_YOUR_WRITES_HEADER.encode(), pin.encode()))
+                headers.append((
+                    b"set-cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={pin}; Max-Age={max_age}; "
+                    f"Path=/; HttpOnly; SameSite=Lax".encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        pin_token = client_pinned_until.set(_client_pin(scope))
+        writes_token = request_writes.set(writes)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_writes.reset(writes_token)
+            client_pinned_until.reset(pin_token)
+
+
+replica_lag_monitor = ReplicaLagMonitor(
+    interval=float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "1.0")),
+)
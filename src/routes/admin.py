@@ -1,11 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta
 
-from src.database import db
-from src.dependencies import get_current_user
-from src.schemas import UserResponse, UserStatusResponse, UserActivateRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from src.cache import user_cache
+from src.database import TIMEOUT_ERRORS, db
+from src.dependencies import require_scope, route_timeout
+from src.events import auth_events
+from src.queries import (
+    DORMANT_USERS_QUERY,
+    INACTIVE_USERS_QUERY,
+    SET_USER_STATUS_QUERY,
+    USER_STATUS_BY_ID_QUERY,
+    bulk_status_by_filters_query,
+    bulk_status_by_ids_query,
+    bulk_status_filters,
+)
+from src.schemas import (
+    AuthEventStatsResponse,
+    BulkUserStatusRequest,
+    BulkUserStatusResponse,
+    UserActivateRequest,
+    UserActivityResponse,
+    UserResponse,
+    UserStatusResponse,
+)
 
 router = APIRouter(prefix="/admin", tags=["Администрирование"])
 
+BULK_STATUS_CHUNK_SIZE = 1000
+REPORT_TIMEOUT_SECONDS = 5.0
+
 
 @router.get(
     "/users/{user_id}/status",
@@ -16,14 +40,9 @@ router = APIRouter(prefix="/admin", tags=["Администрирование"])
 )
 async def get_user_status(
         user_id: int,
-        current_user: dict = Depends(get_current_user)
+        claims: dict = Depends(require_scope("admin:read"))
 ):
-    query = """
-        SELECT id, email, is_active 
-        FROM users 
-        WHERE id = %s
-    """
-    user = db.execute_query(query, (user_id,))
+    user = await db.execute_query_async(USER_STATUS_BY_ID_QUERY, (user_id,), read_only=True, pin_key=user_id)
 
     if not user:
         raise HTTPException(
@@ -50,15 +69,10 @@ async def get_user_status(
 )
 async def activate_user(
         user_id: int,
-        current_user: dict = Depends(get_current_user)
+        claims: dict = Depends(require_scope("admin:write"))
 ):
-    query = """
-        UPDATE users 
-        SET is_active = TRUE 
-        WHERE id = %s 
-        RETURNING id, email, is_active
-    """
-    result = db.execute_query(query, (user_id,))
+    result = await db.execute_query_async(SET_USER_STATUS_QUERY, (True, user_id), pin_key=user_id)
+    user_cache.invalidate(user_id)
 
     if not result:
         raise HTTPException(
@@ -66,6 +80,13 @@ async def activate_user(
             detail="Пользователь не найден",
         )
 
+    auth_events.record(
+        "user_status_changed",
+        user_id=user_id,
+        actor_id=int(claims['sub']),
+        is_active=True,
+    )
+
     return UserStatusResponse(
         id=result[0]['id'],
         email=result[0]['email'],
@@ -83,15 +104,10 @@ async def activate_user(
 )
 async def deactivate_user_admin(
         user_id: int,
-        current_user: dict = Depends(get_current_user)
+        claims: dict = Depends(require_scope("admin:write"))
 ):
-    query = """
-        UPDATE users 
-        SET is_active = FALSE 
-        WHERE id = %s 
-        RETURNING id, email, is_active
-    """
-    result = db.execute_query(query, (user_id,))
+    result = await db.execute_query_async(SET_USER_STATUS_QUERY, (False, user_id), pin_key=user_id)
+    user_cache.invalidate(user_id)
 
     if not result:
         raise HTTPException(
@@ -99,6 +115,13 @@ async def deactivate_user_admin(
             detail="Пользователь не найден",
         )
 
+    auth_events.record(
+        "user_status_changed",
+        user_id=user_id,
+        actor_id=int(claims['sub']),
+        is_active=False,
+    )
+
     return UserStatusResponse(
         id=result[0]['id'],
         email=result[0]['email'],
@@ -117,15 +140,10 @@ async def deactivate_user_admin(
 async def set_user_status(
         user_id: int,
         status_request: UserActivateRequest,
-        current_user: dict = Depends(get_current_user)
+        claims: dict = Depends(require_scope("admin:write"))
 ):
-    query = """
-        UPDATE users 
-        SET is_active = %s 
-        WHERE id = %s 
-        RETURNING id, email, is_active
-    """
-    result = db.execute_query(query, (status_request.is_active, user_id))
+    result = await db.execute_query_async(SET_USER_STATUS_QUERY, (status_request.is_active, user_id), pin_key=user_id)
+    user_cache.invalidate(user_id)
 
     if not result:
         raise HTTPException(
@@ -133,6 +151,13 @@ async def set_user_status(
             detail="Пользователь не найден",
         )
 
+    auth_events.record(
+        "user_status_changed",
+        user_id=user_id,
+        actor_id=int(claims['sub']),
+        is_active=status_request.is_active,
+    )
+
     status_text = "активирован" if result[0]['is_active'] else "деактивирован"
 
     return UserStatusResponse(
@@ -148,21 +173,149 @@ async def set_user_status(
     response_model=list[UserResponse],
     summary="Список неактивных пользователей",
     description="Получение списка деактивированных пользователей",
-    operation_id="get_inactive_users"
+    operation_id="get_inactive_users",
+    dependencies=[Depends(route_timeout(REPORT_TIMEOUT_SECONDS))]
 )
-async def get_inactive_users(current_user: dict = Depends(get_current_user)):
-    query = """
-        SELECT id, email, first_name, last_name, is_active, created_at
-        FROM users 
-        WHERE is_active = FALSE
-        ORDER BY created_at DESC
-    """
+async def get_inactive_users(claims: dict = Depends(require_scope("admin:read"))):
+    try:
+        users = await db.execute_query_async(INACTIVE_USERS_QUERY, read_only=True)
+        return users
+    except TIMEOUT_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при получении списка пользователей: {str(e)}",
+        )
+
 
+@router.get(
+    "/users/dormant",
+    response_model=list[UserActivityResponse],
+    summary="Список давно неактивных пользователей",
+    description="Активные аккаунты, которые не обращались к API указанное количество дней",
+    operation_id="get_dormant_users",
+    dependencies=[Depends(route_timeout(REPORT_TIMEOUT_SECONDS))]
+)
+async def get_dormant_users(
+        days: int = Query(90, ge=1, le=3650, description="Количество дней без активности"),
+        limit: int = Query(100, ge=1, le=1000, description="Максимальное количество пользователей"),
+        claims: dict = Depends(require_scope("admin:read"))
+):
     try:
-        users = db.execute_query(query)
+        users = await db.execute_query_async(
+            DORMANT_USERS_QUERY,
+            (datetime.utcnow() - timedelta(days=days), limit),
+            read_only=True,
+        )
         return users
+    except TIMEOUT_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при получении списка пользователей: {str(e)}",
-        )
\ No newline at end of file
+        )
+
+
+@router.patch(
+    "/users/status",
+    response_model=BulkUserStatusResponse,
+    summary="Массово установить статус пользователей",
+    description="Установка статуса активности для списка ID и/или пользователей, "
+                "подходящих под фильтры (дата создания, домен email). Если обработка "
+                "не уложилась в дедлайн после части порций, возвращается частичный результат "
+                "с completed=false: повторите запрос (для списка ID - с pending_ids). "
+                "Если не закоммичена ни одна порция, ответ 503; прочие ошибки - 500",
+    operation_id="bulk_set_user_status"
+)
+async def bulk_set_user_status(
+        status_request: BulkUserStatusRequest,
+        claims: dict = Depends(require_scope("admin:write"))
+):
+    conditions, params = bulk_status_filters(
+        status_request.created_before, status_request.email_domain
+    )
+    user_ids = list(dict.fromkeys(status_request.user_ids or []))
+    updated_ids = []
+    missing_ids = []
+    processed = 0
+    completed = True
+
+    try:
+        if status_request.user_ids is not None:
+            query = bulk_status_by_ids_query(conditions)
+
+            for start in range(0, len(user_ids), BULK_STATUS_CHUNK_SIZE):
+                chunk = user_ids[start:start + BULK_STATUS_CHUNK_SIZE]
+                result = await db.execute_query_async(
+                    query, [status_request.is_active, chunk] + params
+                )
+                chunk_updated = {row['id'] for row in result}
+                updated_ids.extend(user_id for user_id in chunk if user_id in chunk_updated)
+                missing_ids.extend(user_id for user_id in chunk if user_id not in chunk_updated)
+                processed = start + len(chunk)
+        else:
+            # Обновляем порциями только строки, у которых статус еще не совпадает.
+            # Короткая порция не означает конца: строку, измененную параллельной
+            # транзакцией, FOR UPDATE перепроверяет и может отбросить, поэтому
+            # цикл завершается только на пустой порции
+            query = bulk_status_by_filters_query(conditions)
+
+            while True:
+                result = await db.execute_query_async(
+                    query,
+                    [status_request.is_active, status_request.is_active]
+                    + params
+                    + [BULK_STATUS_CHUNK_SIZE],
+                )
+                if not result:
+                    break
+                updated_ids.extend(sorted(row['id'] for row in result))
+    except TIMEOUT_ERRORS:
+        if not updated_ids:
+            raise
+
+        # Часть порций уже закоммичена, а дедлайн запроса истек: возвращаем частичный
+        # результат, повторный запрос продолжит с оставшихся пользователей
+        print(f"Массовое обновление статуса прервано по таймауту после {len(updated_ids)} пользователей")
+        completed = False
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении статуса пользователей: {str(e)}",
+        )
+    finally:
+        # Порции коммитятся по отдельности: уже обновленных пользователей учитываем
+        # в кеше и аудите, даже если запрос прерван ошибкой или отключением клиента
+        # (CancelledError проходит мимо except, но finally выполняется)
+        db.pin(*updated_ids)
+        user_cache.invalidate(*updated_ids)
+
+        if updated_ids:
+            auth_events.record(
+                "users_bulk_status_changed",
+                actor_id=int(claims['sub']),
+                is_active=status_request.is_active,
+                user_ids=updated_ids,
+            )
+
+    return BulkUserStatusResponse(
+        is_active=status_request.is_active,
+        updated_ids=updated_ids,
+        missing_ids=missing_ids,
+        updated_count=len(updated_ids),
+        completed=completed,
+        pending_ids=[] if completed else user_ids[processed:],
+    )
+
+
+@router.get(
+    "/events/stats",
+    response_model=AuthEventStatsResponse,
+    summary="Состояние журнала событий",
+    description="Метрики очереди событий аутентификации: размер, отброшенные и записанные события",
+    operation_id="get_auth_events_stats"
+)
+async def get_auth_events_stats(claims: dict = Depends(require_scope("admin:read"))):
+    return auth_events.stats()
@@ -1,18 +1,50 @@
+import time
 from datetime import timedelta
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 
 from src.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    INTROSPECTION_CACHE_SECONDS,
     create_access_token,
     get_password_hash,
+    scopes_for_role,
+    try_decode_token,
     verify_password,
 )
-from src.database import db
-from src.schemas import LoginRequest, Token, TokenRequest, UserCreate, UserResponse
+from src.activity import activity_tracker
+from src.cache import user_cache
+from src.database import TIMEOUT_ERRORS, db
+from src.dependencies import require_scope
+from src.events import auth_events
+from src.queries import (
+    INSERT_USER_QUERY,
+    USER_CREDENTIALS_BY_EMAIL_QUERY,
+    USER_ID_BY_EMAIL_QUERY,
+    USER_STATUSES_BY_IDS_QUERY,
+)
+from src.schemas import (
+    IntrospectRequest,
+    IntrospectResponse,
+    IntrospectResult,
+    LoginRequest,
+    Token,
+    TokenRequest,
+    UserCreate,
+    UserResponse,
+)
 
 router = APIRouter(prefix="/auth", tags=["Аутентификация"])
 
+# Пачка крупнее проверяется в пуле потоков: тысяча подписей HS256 заметно
+# задержала бы event loop и все запросы воркера
+INTROSPECT_INLINE_TOKENS = 16
+
+
+def _decode_tokens(tokens):
+    return {token: try_decode_token(token) for token in tokens}
+
 
 @router.post(
     "/register",
@@ -22,8 +54,7 @@ router = APIRouter(prefix="/auth", tags=["Аутентификация"])
     description="Создание нового аккаунта пользователя с email и паролем"
 )
 async def register(user: UserCreate):
-    check_query = "SELECT id FROM users WHERE email = %s"
-    existing_user = db.execute_query(check_query, (user.email,))
+    existing_user = await db.execute_query_async(USER_ID_BY_EMAIL_QUERY, (user.email,))
 
     if existing_user:
         raise HTTPException(
@@ -31,20 +62,16 @@ async def register(user: UserCreate):
             detail="Пользователь с таким email уже существует",
         )
 
-    hashed_password = get_password_hash(user.password)
-
-    insert_query = """
-    INSERT INTO users (email, password_hash, first_name, last_name, is_active)
-    VALUES (%s, %s, %s, %s, %s)
-    RETURNING id, email, first_name, last_name, is_active, created_at
-    """
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
 
     try:
-        new_user = db.execute_query(
-            insert_query,
+        new_user = await db.execute_query_async(
+            INSERT_USER_QUERY,
             (user.email, hashed_password, user.first_name, user.last_name, True),
         )
         return new_user[0]
+    except TIMEOUT_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -58,17 +85,28 @@ async def register(user: UserCreate):
     summary="Получение JWT токена",
     description="Аутентификация пользователя по email и паролю для получения access token через JSON"
 )
-async def login_for_access_token(token_request: TokenRequest):
+async def login_for_access_token(token_request: TokenRequest, request: Request):
     """
     Получение JWT токена для аутентификации.
 
     - **email**: Email пользователя
     - **password**: Пароль пользователя
     """
-    query = "SELECT id, email, password_hash, is_active FROM users WHERE email = %s"
-    user = db.execute_query(query, (token_request.email,))
+    user = await db.execute_query_async(USER_CREDENTIALS_BY_EMAIL_QUERY, (token_request.email,))
+    client_ip = request.client.host if request.client else None
+
+    # bcrypt выполняется в пуле потоков, чтобы не блокировать event loop
+    password_valid = bool(user) and await run_in_threadpool(
+        verify_password, token_request.password, user[0]['password_hash']
+    )
 
-    if not user or not verify_password(token_request.password, user[0]['password_hash']):
+    if not password_valid:
+        auth_events.record(
+            "login_failed",
+            user_id=user[0]['id'] if user else None,
+            email=token_request.email,
+            ip_address=client_ip,
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -76,6 +114,12 @@ async def login_for_access_token(token_request: TokenRequest):
         )
 
     if not user[0]['is_active']:
+        auth_events.record(
+            "login_blocked",
+            user_id=user[0]['id'],
+            email=token_request.email,
+            ip_address=client_ip,
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь деактивирован",
@@ -84,8 +128,17 @@ async def login_for_access_token(token_request: TokenRequest):
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user[0]['id'])},
+        data={"sub": str(user[0]['id']), "role": user[0]['role']},
         expires_delta=access_token_expires,
+        scopes=scopes_for_role(user[0]['role']),
+    )
+
+    activity_tracker.record_login(user[0]['id'])
+    auth_events.record(
+        "login_succeeded",
+        user_id=user[0]['id'],
+        email=token_request.email,
+        ip_address=client_ip,
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -97,17 +150,28 @@ async def login_for_access_token(token_request: TokenRequest):
     summary="Альтернативный вход (совместимость)",
     description="Аутентификация через JSON body (аналогично /token)"
 )
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request):
     """
     Альтернативный endpoint для входа (совместимость со старыми версиями).
 
     - **email**: Email пользователя
     - **password**: Пароль пользователя
     """
-    query = "SELECT id, email, password_hash, is_active FROM users WHERE email = %s"
-    user = db.execute_query(query, (login_data.email,))
+    user = await db.execute_query_async(USER_CREDENTIALS_BY_EMAIL_QUERY, (login_data.email,))
+    client_ip = request.client.host if request.client else None
 
-    if not user or not verify_password(login_data.password, user[0]['password_hash']):
+    # bcrypt выполняется в пуле потоков, чтобы не блокировать event loop
+    password_valid = bool(user) and await run_in_threadpool(
+        verify_password, login_data.password, user[0]['password_hash']
+    )
+
+    if not password_valid:
+        auth_events.record(
+            "login_failed",
+            user_id=user[0]['id'] if user else None,
+            email=login_data.email,
+            ip_address=client_ip,
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -115,6 +179,12 @@ async def login(login_data: LoginRequest):
         )
 
     if not user[0]['is_active']:
+        auth_events.record(
+            "login_blocked",
+            user_id=user[0]['id'],
+            email=login_data.email,
+            ip_address=client_ip,
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь деактивирован",
@@ -123,8 +193,96 @@ async def login(login_data: LoginRequest):
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user[0]['id'])},
+        data={"sub": str(user[0]['id']), "role": user[0]['role']},
         expires_delta=access_token_expires,
+        scopes=scopes_for_role(user[0]['role']),
     )
 
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    activity_tracker.record_login(user[0]['id'])
+    auth_events.record(
+        "login_succeeded",
+        user_id=user[0]['id'],
+        email=login_data.email,
+        ip_address=client_ip,
+    )
+
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.post(
+    "/introspect",
+    response_model=IntrospectResponse,
+    summary="Пакетная проверка токенов",
+    description="Проверка подписи и срока действия набора access token и статуса их "
+                "пользователей за один запрос (для API-шлюзов)"
+)
+async def introspect_tokens(
+        introspect_request: IntrospectRequest,
+        response: Response,
+        claims: dict = Depends(require_scope("auth:introspect"))
+):
+    """
+    Проверка токенов пачкой: подписи проверяются локально, статусы пользователей
+    берутся из кеша или одним запросом `WHERE id = ANY(...)`.
+
+    - **tokens**: Список access token
+    """
+    tokens = list(dict.fromkeys(introspect_request.tokens))
+    if len(tokens) <= INTROSPECT_INLINE_TOKENS:
+        payloads = _decode_tokens(tokens)
+    else:
+        payloads = await run_in_threadpool(_decode_tokens, tokens)
+
+    user_ids = {
+        int(payload["sub"])
+        for payload in payloads.values()
+        if payload is not None and str(payload["sub"]).isdigit()
+    }
+    user_statuses = {}
+    missing_ids = []
+    for user_id in user_ids:
+        cached_user = user_cache.get(user_id)
+        if cached_user is not None:
+            user_statuses[user_id] = cached_user['is_active']
+        else:
+            missing_ids.append(user_id)
+
+    if missing_ids:
+        rows = await db.execute_query_async(USER_STATUSES_BY_IDS_QUERY, (missing_ids,), read_only=True)
+        for row in rows:
+            user_statuses[row['id']] = row['is_active']
+
+    now = int(time.time())
+    results = []
+    for token in introspect_request.tokens:
+        payload = payloads[token]
+        if payload is None:
+            # Поддельный или истекший токен действительным уже не станет
+            results.append(IntrospectResult(active=False, cache_ttl=INTROSPECTION_CACHE_SECONDS))
+            continue
+
+        sub = str(payload["sub"])
+        user_active = user_statuses.get(int(sub)) if sub.isdigit() else None
+        active = bool(user_active)
+        # Положительный результат нельзя хранить дольше срока жизни токена;
+        # токен без exp бессрочен, для него остается обычный TTL
+        cache_ttl = INTROSPECTION_CACHE_SECONDS
+        exp = payload.get("exp")
+        if active and exp is not None:
+            cache_ttl = min(cache_ttl, max(exp - now, 0))
+
+        results.append(IntrospectResult(
+            active=active,
+            sub=sub,
+            scope=payload.get("scope"),
+            role=payload.get("role"),
+            exp=exp,
+            user_active=user_active,
+            cache_ttl=cache_ttl,
+        ))
+
+    # Ответ на POST с набором токенов повторно не используется: шлюз кеширует
+    # каждый результат по своему токену на cache_ttl секунд
+    response.headers["Cache-Control"] = "no-store"
+
+    return IntrospectResponse(results=results)
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
-from src.database import db
+from src.cache import user_cache
+from src.database import TIMEOUT_ERRORS, db
 from src.dependencies import get_current_user
+from src.http_cache import conditional_get, row_version, user_etag
+from src.queries import DEACTIVATE_USER_QUERY, PROFILE_COLUMNS, update_profile_query
 from src.schemas import UserResponse, UserUpdate
 
 router = APIRouter(prefix="/users/me", tags=["Профиль пользователя"])
@@ -14,7 +17,17 @@ router = APIRouter(prefix="/users/me", tags=["Профиль пользоват
     description="Получение информации о текущем аутентифицированном пользователе",
     operation_id="get_current_user_profile"
 )
-async def read_users_me(current_user: dict = Depends(get_current_user)):
+async def read_users_me(
+        request: Request,
+        response: Response,
+        current_user: dict = Depends(get_current_user)
+):
+    not_modified = conditional_get(
+        request, response, current_user['id'], row_version(current_user)
+    )
+    if not_modified is not None:
+        return not_modified
+
     return current_user
 
 
@@ -27,41 +40,31 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
 )
 async def update_user(
         user_update: UserUpdate,
+        response: Response,
         current_user: dict = Depends(get_current_user)
 ):
-    update_fields = []
-    update_values = []
-
-    if user_update.first_name is not None:
-        update_fields.append("first_name = %s")
-        update_values.append(user_update.first_name)
+    update_values = {
+        column: getattr(user_update, column)
+        for column in PROFILE_COLUMNS
+        if getattr(user_update, column) is not None
+    }
 
-    if user_update.last_name is not None:
-        update_fields.append("last_name = %s")
-        update_values.append(user_update.last_name)
-
-    if user_update.is_active is not None:
-        update_fields.append("is_active = %s")
-        update_values.append(user_update.is_active)
-
-    if not update_fields:
+    if not update_values:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    update_values.append(current_user['id'])
-
-    query = f"""
-        UPDATE users 
-        SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
-        WHERE id = %s
-        RETURNING id, email, first_name, last_name, is_active, created_at
-    """
+    query = update_profile_query(list(update_values))
+    params = list(update_values.values()) + [current_user['id']]
 
     try:
-        updated_user = db.execute_query(query, update_values)
+        updated_user = await db.execute_query_async(query, params, pin_key=current_user['id'])
+        user_cache.invalidate(current_user['id'], version=row_version(updated_user[0]))
+        response.headers["ETag"] = user_etag(current_user['id'], row_version(updated_user[0]))
         return updated_user[0]
+    except TIMEOUT_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -76,8 +79,10 @@ async def update_user(
     operation_id="deactivate_own_account"
 )
 async def deactivate_user(current_user: dict = Depends(get_current_user)):
-    query = "UPDATE users SET is_active = FALSE WHERE id = %s RETURNING id"
-    result = db.execute_query(query, (current_user['id'],))
+    result = await db.execute_query_async(
+        DEACTIVATE_USER_QUERY, (current_user['id'],), pin_key=current_user['id']
+    )
+    user_cache.invalidate(current_user['id'])
 
     if not result:
         raise HTTPException(
@@ -1,11 +1,152 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Optional
 
-from src.database import db
-from src.dependencies import get_current_user
-from src.schemas import UserListResponse, UserResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from src.cache import user_cache
+from src.database import TIMEOUT_ERRORS, db
+from src.dependencies import get_current_user, require_scope, route_timeout
+from src.http_cache import conditional_get, is_conditional, row_version
+from src.notifications import user_change_feed
+from src.queries import (
+    SEARCH_CANDIDATE_LIMIT,
+    SEARCH_USERS_AFTER_CURSOR_QUERY,
+    SEARCH_USERS_QUERY,
+    USER_BY_ID_QUERY,
+    USER_COUNT_ESTIMATE_QUERY,
+    USER_COUNT_QUERY,
+    USER_PAGE_QUERY,
+    USER_VERSION_BY_ID_QUERY,
+)
+from src.schemas import UserListResponse, UserResponse, UserSearchResponse
 
 router = APIRouter(prefix="/users", tags=["Управление пользователями"])
 
+CHANGES_HEARTBEAT_SECONDS = 15
+SEARCH_TIMEOUT_SECONDS = 2.0
+COUNT_TIMEOUT_SECONDS = 2.0
+
+
+def _encode_search_cursor(rank: Decimal, user_id: int) -> str:
+    raw = f"{rank}:{user_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_search_cursor(cursor: str) -> tuple[Decimal, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, user_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return Decimal(rank), int(user_id)
+    except (ValueError, InvalidOperation, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор",
+        )
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get(
+    "/search",
+    response_model=UserSearchResponse,
+    summary="Поиск пользователей",
+    description="Поиск по префиксу и нечеткое совпадение по email, имени и фамилии "
+                "с ранжированием результатов и курсорной пагинацией. Ранжируются "
+                f"{SEARCH_CANDIDATE_LIMIT} ближайших совпадений: уточните запрос, если "
+                "нужного пользователя нет среди них",
+    operation_id="search_users",
+    dependencies=[Depends(route_timeout(SEARCH_TIMEOUT_SECONDS))]
+)
+async def search_users(
+        q: str = Query(..., min_length=3, max_length=255, description="Строка поиска"),
+        limit: int = Query(20, ge=1, le=100, description="Максимальное количество результатов"),
+        cursor: Optional[str] = Query(None, description="Курсор из предыдущего ответа"),
+        current_user: dict = Depends(get_current_user)
+):
+    params = {
+        "q": q,
+        "prefix": _escape_like(q) + "%",
+        "limit": limit + 1,
+        "candidates": SEARCH_CANDIDATE_LIMIT,
+    }
+    query = SEARCH_USERS_QUERY
+
+    if cursor is not None:
+        params["cursor_rank"], params["cursor_id"] = _decode_search_cursor(cursor)
+        query = SEARCH_USERS_AFTER_CURSOR_QUERY
+
+    try:
+        users = await db.execute_query_async(query, params, read_only=True)
+    except TIMEOUT_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при поиске пользователей: {str(e)}",
+        )
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = _encode_search_cursor(users[-1]['rank'], users[-1]['id'])
+
+    return UserSearchResponse(users=users, next_cursor=next_cursor)
+
+
+@router.get(
+    "/changes",
+    summary="Поток изменений пользователей",
+    description="Server-Sent Events (format=sse) или NDJSON (format=ndjson) с изменениями "
+                "пользователей для поддержания внешних кешей. Событие resync означает, "
+                "что часть изменений пропущена и кеш нужно сбросить",
+    operation_id="stream_user_changes"
+)
+async def stream_user_changes(
+        stream_format: str = Query(
+            "sse",
+            alias="format",
+            pattern="^(sse|ndjson)$",
+            description="Формат потока"
+        ),
+        claims: dict = Depends(require_scope("users:changes"))
+):
+    queue = user_change_feed.subscribe()
+    is_sse = stream_format == "sse"
+
+    def encode(event, change):
+        data = json.dumps(change, default=str)
+        if is_sse:
+            return f"event: {event}\ndata: {data}\n\n"
+        return json.dumps({"event": event, "data": change}, default=str) + "\n"
+
+    async def changes():
+        try:
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), CHANGES_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n" if is_sse else "\n"
+                    continue
+
+                if change is None:
+                    yield encode("resync", {})
+                    break
+                yield encode("user_changed", change)
+        finally:
+            user_change_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        changes(),
+        media_type="text/event-stream" if is_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.get(
     "/{user_id}",
@@ -14,13 +155,29 @@ router = APIRouter(prefix="/users", tags=["Управление пользова
     description="Получение информации о пользователе по его идентификатору",
     operation_id="get_user_by_id"
 )
-async def get_user(user_id: int, current_user: dict = Depends(get_current_user)):
-    query = """
-        SELECT id, email, first_name, last_name, is_active, created_at 
-        FROM users 
-        WHERE id = %s
-    """
-    user = db.execute_query(query, (user_id,))
+async def get_user(
+        user_id: int,
+        request: Request,
+        response: Response,
+        current_user: dict = Depends(get_current_user)
+):
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        not_modified = conditional_get(request, response, user_id, row_version(cached_user))
+        return not_modified if not_modified is not None else cached_user
+
+    if is_conditional(request):
+        # Легкая проверка версии: при совпадении полную строку не читаем и не сериализуем
+        version = await db.execute_query_async(
+            USER_VERSION_BY_ID_QUERY, (user_id,), read_only=True, pin_key=user_id
+        )
+        if version:
+            not_modified = conditional_get(request, response, user_id, version[0]['updated_at'])
+            if not_modified is not None:
+                return not_modified
+
+    cache_token = user_cache.token()
+    user = await db.execute_query_async(USER_BY_ID_QUERY, (user_id,), read_only=True, pin_key=user_id)
 
     if not user:
         raise HTTPException(
@@ -28,6 +185,8 @@ async def get_user(user_id: int, current_user: dict = Depends(get_current_user))
             detail="Пользователь не найден",
         )
 
+    user_cache.set(user_id, user[0], cache_token)
+    conditional_get(request, response, user_id, row_version(user[0]))
     return user[0]
 
 
@@ -35,7 +194,9 @@ async def get_user(user_id: int, current_user: dict = Depends(get_current_user))
     "",
     response_model=UserListResponse,
     summary="Список пользователей",
-    description="Получение списка всех пользователей с пагинацией",
+    description="Получение списка всех пользователей с пагинацией. Если точный подсчет "
+                f"не уложился в {COUNT_TIMEOUT_SECONDS:g} с, total - оценка по статистике таблицы и total_estimated=true; "
+                "таймаут самой страницы - 503",
     operation_id="get_all_users"
 )
 async def get_users(
@@ -45,25 +206,29 @@ async def get_users(
 ):
     offset = (page - 1) * size
 
-    query = """
-        SELECT id, email, first_name, last_name, is_active, created_at
-        FROM users 
-        ORDER BY created_at DESC
-        LIMIT %s OFFSET %s
-    """
-
-    count_query = "SELECT COUNT(*) FROM users"
-
     try:
-        users = db.execute_query(query, (size, offset))
-        total_count = db.execute_query(count_query)[0]['count']
+        users = await db.execute_query_async(USER_PAGE_QUERY, (size, offset), read_only=True)
+
+        # COUNT(*) читает всю таблицу, поэтому ограничен собственным таймаутом;
+        # если он не уложился, отдаем страницу с оценкой вместо ошибки
+        total_estimated = False
+        try:
+            count_result = await db.execute_query_async(
+                USER_COUNT_QUERY, read_only=True, timeout=COUNT_TIMEOUT_SECONDS
+            )
+        except TIMEOUT_ERRORS:
+            count_result = await db.execute_query_async(USER_COUNT_ESTIMATE_QUERY, read_only=True)
+            total_estimated = True
 
         return UserListResponse(
             users=users,
-            total=total_count,
+            total=count_result[0]['count'],
+            total_estimated=total_estimated,
             page=page,
             size=size
         )
+    except TIMEOUT_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
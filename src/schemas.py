@@ -1,8 +1,9 @@
 from datetime import datetime
 from typing import Any, Optional
-import re
 
-from pydantic import BaseModel, EmailStr, Field, field_validator, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator, ConfigDict
+
+from src.password_policy import validate_password
 
 
 class TokenRequest(BaseModel):
@@ -31,21 +32,7 @@ class UserCreate(UserBase):
     @field_validator('password')
     @classmethod
     def validate_password_strength(cls, v: str, info: Any) -> str:
-        if len(v) < 8:
-            raise ValueError('Пароль должен содержать минимум 8 символов')
-
-        checks = [
-            (r'[A-Z]', 'заглавную букву'),
-            (r'[a-z]', 'строчную букву'),
-            (r'[0-9]', 'цифру'),
-            (r'[!@#$%^&*(),.?":{}|<>]', 'специальный символ'),
-        ]
-
-        for pattern, requirement in checks:
-            if not re.search(pattern, v):
-                raise ValueError(f'Пароль должен содержать хотя бы одну {requirement}')
-
-        return v
+        return validate_password(v)
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -93,6 +80,42 @@ class UserResponse(UserBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserActivityResponse(UserResponse):
+    last_login_at: Optional[datetime] = Field(None, description="Дата и время последнего входа")
+    last_seen_at: Optional[datetime] = Field(None, description="Дата и время последнего обращения к API")
+
+
+class UserSearchResult(UserResponse):
+    rank: float = Field(..., description="Релевантность совпадения")
+
+
+class UserSearchResponse(BaseModel):
+    users: list[UserSearchResult] = Field(..., description="Найденные пользователи")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Курсор для получения следующей порции результатов"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "users": [
+                    {
+                        "id": 1,
+                        "email": "ivanov@example.com",
+                        "first_name": "Иван",
+                        "last_name": "Иванов",
+                        "is_active": True,
+                        "created_at": "2024-01-15T10:30:00",
+                        "rank": 1.5
+                    }
+                ],
+                "next_cursor": "MS41MDAwMDA6MQ"
+            }
+        }
+    )
+
+
 class Token(BaseModel):
     access_token: str = Field(..., description="JWT access token")
     token_type: str = Field(..., description="Тип токена")
@@ -107,6 +130,61 @@ class Token(BaseModel):
     )
 
 
+class IntrospectRequest(BaseModel):
+    tokens: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Access token для проверки"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "tokens": ["eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."]
+            }
+        }
+    )
+
+
+class IntrospectResult(BaseModel):
+    active: bool = Field(..., description="Токен действителен и пользователь активен")
+    sub: Optional[str] = Field(None, description="ID пользователя")
+    scope: Optional[str] = Field(None, description="Права токена через пробел")
+    role: Optional[str] = Field(None, description="Роль пользователя")
+    exp: Optional[int] = Field(None, description="Время истечения токена (Unix time)")
+    user_active: Optional[bool] = Field(None, description="Статус активности пользователя")
+    cache_ttl: int = Field(
+        ...,
+        description="Сколько секунд шлюз может кешировать результат для этого токена"
+    )
+
+
+class IntrospectResponse(BaseModel):
+    results: list[IntrospectResult] = Field(
+        ...,
+        description="Результаты проверки в порядке переданных токенов"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "results": [
+                    {
+                        "active": True,
+                        "sub": "1",
+                        "scope": "",
+                        "role": "user",
+                        "exp": 1705750000,
+                        "user_active": True,
+                        "cache_ttl": 30
+                    }
+                ]
+            }
+        }
+    )
+
+
 class TokenData(BaseModel):
     user_id: Optional[int] = Field(None, description="ID пользователя")
 
@@ -137,21 +215,7 @@ class PasswordChangeRequest(BaseModel):
     @field_validator('new_password')
     @classmethod
     def validate_new_password_strength(cls, v: str) -> str:
-        if len(v) < 8:
-            raise ValueError('Пароль должен содержать минимум 8 символов')
-
-        checks = [
-            (r'[A-Z]', 'заглавную букву'),
-            (r'[a-z]', 'строчную букву'),
-            (r'[0-9]', 'цифру'),
-            (r'[!@#$%^&*(),.?":{}|<>]', 'специальный символ'),
-        ]
-
-        for pattern, requirement in checks:
-            if not re.search(pattern, v):
-                raise ValueError(f'Пароль должен содержать хотя бы одну {requirement}')
-
-        return v
+        return validate_password(v)
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -187,21 +251,7 @@ class PasswordResetConfirm(BaseModel):
     @field_validator('new_password')
     @classmethod
     def validate_reset_password_strength(cls, v: str) -> str:
-        if len(v) < 8:
-            raise ValueError('Пароль должен содержать минимум 8 символов')
-
-        checks = [
-            (r'[A-Z]', 'заглавную букву'),
-            (r'[a-z]', 'строчную букву'),
-            (r'[0-9]', 'цифру'),
-            (r'[!@#$%^&*(),.?":{}|<>]', 'специальный символ'),
-        ]
-
-        for pattern, requirement in checks:
-            if not re.search(pattern, v):
-                raise ValueError(f'Пароль должен содержать хотя бы одну {requirement}')
-
-        return v
+        return validate_password(v)
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -216,6 +266,10 @@ class PasswordResetConfirm(BaseModel):
 class UserListResponse(BaseModel):
     users: list[UserResponse] = Field(..., description="Список пользователей")
     total: int = Field(..., description="Общее количество пользователей")
+    total_estimated: bool = Field(
+        False,
+        description="total - оценка по статистике таблицы: точный подсчет не уложился в таймаут"
+    )
     page: int = Field(..., description="Текущая страница")
     size: int = Field(..., description="Размер страницы")
 
@@ -241,6 +295,7 @@ class UserListResponse(BaseModel):
                     }
                 ],
                 "total": 2,
+                "total_estimated": False,
                 "page": 1,
                 "size": 10
             }
@@ -287,6 +342,17 @@ class HealthCheckResponse(BaseModel):
         }
     )
 
+class AuthEventStatsResponse(BaseModel):
+    queued: int = Field(..., description="Событий в очереди на запись")
+    max_queue_size: int = Field(..., description="Максимальный размер очереди")
+    recorded: int = Field(..., description="Принято событий с момента запуска")
+    dropped: int = Field(..., description="Отброшено из-за переполнения очереди")
+    written: int = Field(..., description="Записано в базу данных")
+    failed: int = Field(..., description="Потеряно из-за ошибок записи")
+    batches: int = Field(..., description="Количество записанных пакетов")
+    last_flush_ms: float = Field(..., description="Длительность последней записи пакета, мс")
+
+
 class UserActivateRequest(BaseModel):
     is_active: bool = Field(..., description="Статус активности пользователя")
 
@@ -314,3 +380,72 @@ class UserStatusResponse(BaseModel):
             }
         }
     )
+
+
+class BulkUserStatusRequest(BaseModel):
+    is_active: bool = Field(..., description="Новый статус активности пользователей")
+    user_ids: Optional[list[int]] = Field(
+        None,
+        min_length=1,
+        max_length=50000,
+        description="Список ID пользователей"
+    )
+    created_before: Optional[datetime] = Field(
+        None,
+        description="Только пользователи, созданные раньше указанной даты"
+    )
+    email_domain: Optional[str] = Field(
+        None,
+        min_length=3,
+        max_length=255,
+        pattern=r'^[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+$',
+        description="Только пользователи с email в указанном домене"
+    )
+
+    @model_validator(mode='after')
+    def validate_selection(self) -> 'BulkUserStatusRequest':
+        if self.user_ids is None and self.created_before is None and self.email_domain is None:
+            raise ValueError('Укажите user_ids или хотя бы один фильтр')
+        return self
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "is_active": False,
+                "user_ids": [1, 2, 3],
+                "email_domain": "example.com"
+            }
+        }
+    )
+
+
+class BulkUserStatusResponse(BaseModel):
+    is_active: bool = Field(..., description="Установленный статус активности")
+    updated_ids: list[int] = Field(..., description="ID обновленных пользователей")
+    missing_ids: list[int] = Field(
+        ...,
+        description="ID из запроса, которые не найдены или не подходят под фильтры"
+    )
+    updated_count: int = Field(..., description="Количество обновленных пользователей")
+    completed: bool = Field(
+        True,
+        description="False, если обработка прервана после части порций: "
+                    "повторите запрос, уже обновленные пользователи не затрагиваются"
+    )
+    pending_ids: list[int] = Field(
+        default_factory=list,
+        description="ID из запроса, до которых обработка не дошла"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "is_active": False,
+                "updated_ids": [1, 2],
+                "missing_ids": [3],
+                "updated_count": 2,
+                "completed": True,
+                "pending_ids": []
+            }
+        }
+    )
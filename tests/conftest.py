@@ -0,0 +1,11 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "postgres: нужен реальный PostgreSQL с pg_trgm (DSN в QUERY_PLAN_DSN)",
+    )
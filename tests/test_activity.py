@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from src import activity  # noqa: E402
+from src.activity import ACTIVITY_FLUSH_PAGE_SIZE, ActivityTracker  # noqa: E402
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.calls = []
+
+    async def execute_values_async(self, query, rows, **kwargs):
+        self.calls.append((rows, kwargs))
+
+
+def test_flush_pages_large_batches(monkeypatch):
+    fake = FakeDatabase()
+    monkeypatch.setattr(activity, "db", fake)
+    tracker = ActivityTracker()
+    for user_id in range(ACTIVITY_FLUSH_PAGE_SIZE * 3, 0, -1):
+        tracker.record_seen(user_id)
+
+    asyncio.run(tracker.flush())
+
+    (rows, kwargs), = fake.calls
+    assert kwargs["page_size"] == ACTIVITY_FLUSH_PAGE_SIZE
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+    assert len(rows) == ACTIVITY_FLUSH_PAGE_SIZE * 3
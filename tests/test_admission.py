@@ -0,0 +1,206 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("psycopg2")
+
+from src.admission import ClientDisconnectMiddleware  # noqa: E402
+
+
+def http_scope(path="/users", headers=()):
+    return {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+
+
+class Client:
+    """Сторона сервера ASGI: очередь входящих сообщений и записанные ответы."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "http.disconnect"})
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_disconnect_before_response_cancels_app():
+    state = {"cancelled": False}
+
+    async def scenario():
+        client = Client()
+        waiting = asyncio.Event()
+
+        async def app(scope, receive, send):
+            waiting.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        async def disconnect_while_waiting():
+            await waiting.wait()
+            client.disconnect()
+
+        middleware = ClientDisconnectMiddleware(app)
+        client.incoming.put_nowait({"type": "http.request", "body": b"", "more_body": False})
+        disconnecter = asyncio.create_task(disconnect_while_waiting())
+        await middleware(http_scope(), client.receive, client.send)
+        await disconnecter
+        return middleware, client
+
+    middleware, client = run(scenario())
+
+    assert state["cancelled"]
+    assert middleware.cancelled == 1
+    assert client.sent == []
+
+
+def test_disconnect_after_response_start_does_not_cancel():
+    state = {"finished": False}
+
+    async def scenario():
+        client = Client()
+        started = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            started.set()
+            await asyncio.sleep(0.05)
+            await send({"type": "http.response.body", "body": b"ok"})
+            state["finished"] = True
+
+        async def disconnect_after_start():
+            await started.wait()
+            client.disconnect()
+
+        middleware = ClientDisconnectMiddleware(app)
+        disconnecter = asyncio.create_task(disconnect_after_start())
+        await middleware(http_scope(), client.receive, client.send)
+        await disconnecter
+        return middleware, client
+
+    middleware, client = run(scenario())
+
+    assert state["finished"]
+    assert middleware.cancelled == 0
+    assert [message["type"] for message in client.sent] == ["http.response.start", "http.response.body"]
+
+
+def test_request_body_is_passed_to_app():
+    async def scenario():
+        client = Client()
+        received = []
+
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                received.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    break
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"".join(received)})
+
+        middleware = ClientDisconnectMiddleware(app)
+        client.incoming.put_nowait({"type": "http.request", "body": b"ab", "more_body": True})
+        client.incoming.put_nowait({"type": "http.request", "body": b"cd", "more_body": False})
+        await middleware(
+            http_scope(headers=[(b"content-length", b"4")]),
+            client.receive,
+            client.send,
+        )
+        return middleware, client
+
+    middleware, client = run(scenario())
+
+    assert middleware.cancelled == 0
+    assert client.sent[-1]["body"] == b"abcd"
+
+
+def test_disconnect_while_app_waits_after_body_cancels_app():
+    state = {"cancelled": False}
+
+    async def scenario():
+        client = Client()
+        body_read = asyncio.Event()
+
+        async def app(scope, receive, send):
+            message = await receive()
+            assert message["body"] == b"{}"
+            body_read.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        async def disconnect_after_body():
+            await body_read.wait()
+            client.disconnect()
+
+        middleware = ClientDisconnectMiddleware(app)
+        client.incoming.put_nowait({"type": "http.request", "body": b"{}", "more_body": False})
+        disconnecter = asyncio.create_task(disconnect_after_body())
+        await middleware(
+            http_scope(headers=[(b"content-length", b"2")]),
+            client.receive,
+            client.send,
+        )
+        await disconnecter
+        return middleware
+
+    middleware = run(scenario())
+
+    assert state["cancelled"]
+    assert middleware.cancelled == 1
+
+
+def test_empty_body_without_content_length_is_buffered_for_app():
+    async def scenario():
+        client = Client()
+
+        async def app(scope, receive, send):
+            # Наблюдатель уже забрал сообщение с пустым телом: приложение получает его из буфера
+            message = await receive()
+            assert message == {"type": "http.request", "body": b"", "more_body": False}
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = ClientDisconnectMiddleware(app)
+        client.incoming.put_nowait({"type": "http.request", "body": b"", "more_body": False})
+        await middleware(http_scope(), client.receive, client.send)
+        return middleware, client
+
+    middleware, client = run(scenario())
+
+    assert middleware.cancelled == 0
+    assert client.sent[0]["status"] == 204
+
+
+def test_exempt_paths_are_not_watched():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def scenario():
+        client = Client()
+        client.disconnect()
+        middleware = ClientDisconnectMiddleware(app, exempt_paths=("/users",))
+        await middleware(http_scope(), client.receive, client.send)
+        return middleware, client
+
+    middleware, client = run(scenario())
+
+    assert middleware.cancelled == 0
+    assert len(client.sent) == 2
+    assert client.incoming.qsize() == 1
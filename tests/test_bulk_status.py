@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("psycopg2")
+
+from fastapi import HTTPException  # noqa: E402
+from psycopg2 import errors  # noqa: E402
+
+from src.routes import admin  # noqa: E402
+from src.schemas import BulkUserStatusRequest  # noqa: E402
+
+CLAIMS = {"sub": "1", "scope": "admin:write"}
+
+
+class FakeDatabase:
+    """Выдает заранее заданные результаты порций; исключение в списке бросается."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+        self.pinned = []
+
+    async def execute_query_async(self, query, params=None, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return [{"id": user_id} for user_id in result]
+
+    def pin(self, *keys):
+        self.pinned.extend(keys)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def install(*results):
+        fake = FakeDatabase(*results)
+        monkeypatch.setattr(admin, "db", fake)
+        monkeypatch.setattr(admin, "BULK_STATUS_CHUNK_SIZE", 2)
+        return fake
+
+    return install
+
+
+def bulk(**request):
+    return asyncio.run(admin.bulk_set_user_status(BulkUserStatusRequest(**request), claims=CLAIMS))
+
+
+def test_filter_path_continues_after_short_chunk_until_empty(database):
+    # Короткая порция (строка отброшена после перепроверки FOR UPDATE) не завершает обход
+    fake = database([1], [2, 3], [])
+
+    response = bulk(is_active=False, email_domain="example.com")
+
+    assert response.completed
+    assert response.updated_ids == [1, 2, 3]
+    assert fake.calls == 3
+
+
+def test_timeout_after_committed_chunk_returns_partial_result(database):
+    fake = database([1, 2], errors.QueryCanceled())
+
+    response = bulk(is_active=False, user_ids=[1, 2, 3, 4])
+
+    assert not response.completed
+    assert response.updated_ids == [1, 2]
+    assert response.pending_ids == [3, 4]
+    assert fake.pinned == [1, 2]
+
+
+def test_timeout_before_any_chunk_is_raised(database):
+    database(errors.QueryCanceled())
+
+    with pytest.raises(errors.QueryCanceled):
+        bulk(is_active=False, user_ids=[1, 2])
+
+
+def test_other_errors_are_500_but_committed_chunks_are_accounted(database):
+    fake = database([1, 2], errors.UniqueViolation())
+
+    with pytest.raises(HTTPException) as raised:
+        bulk(is_active=False, user_ids=[1, 2, 3])
+
+    assert raised.value.status_code == 500
+    assert fake.pinned == [1, 2]
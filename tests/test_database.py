@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import psycopg2  # noqa: E402
+from psycopg2 import errors  # noqa: E402
+
+from src import database as database_module  # noqa: E402
+from src.database import Database, statement_deadline  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+
+    def execute(self, query, params=None):
+        self.conn.statements.append(query)
+        outcome = self.conn.outcomes.pop(0) if self.conn.outcomes else [{"ok": 1}]
+        if callable(outcome):
+            outcome = outcome(self.conn)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        self.rows = outcome
+        self.description = [("ok",)]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера: результаты execute задаются списком outcomes.
+
+    Исключение в списке бросается, callable вызывается с соединением,
+    остальное возвращается как строки результата.
+    """
+
+    def __init__(self, outcomes=()):
+        self.outcomes = list(outcomes)
+        self.statements = []
+        self.closed = False
+        self.commits = 0
+        self.rollbacks = 0
+        self.statement_timeout_changed = False
+        self.cancelled = threading.Event()
+        self.cancel_thread = None
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def cancel(self):
+        self.cancel_thread = threading.current_thread().name
+        self.cancelled.set()
+
+
+def connection_lost(conn):
+    conn.closed = True
+    return psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database(primary_dsn="dbname=test", replica_dsns=[])
+    database.query_retries = 3
+    database.retry_base_delay = 0.001
+    database.retry_max_delay = 0.002
+    database.opened = []
+
+    def open_connection(dsn):
+        conn = database.next_connection()
+        database.opened.append(conn)
+        return conn
+
+    database.next_connection = FakeConnection
+    monkeypatch.setattr(database, "open_connection", open_connection)
+    yield database
+    database.connection = None
+    database.disconnect()
+
+
+def connect(database, *outcomes):
+    conn = FakeConnection(outcomes)
+    database.next_connection = lambda: conn
+    return conn
+
+
+def query(database, sql="SELECT 1", **kwargs):
+    return asyncio.run(database.execute_query_async(sql, **kwargs))
+
+
+def test_serialization_failure_is_retried(database):
+    conn = connect(database, errors.SerializationFailure(), errors.SerializationFailure(), [{"id": 1}])
+
+    assert query(database) == [{"id": 1}]
+    assert len(conn.statements) == 3
+    assert conn.rollbacks == 2
+
+
+def test_deadlock_is_retried_for_writes(database):
+    conn = connect(database, errors.DeadlockDetected(), [{"id": 1}])
+
+    assert query(database, "UPDATE users SET is_active = FALSE WHERE id = 1 RETURNING id") == [{"id": 1}]
+    assert len(conn.statements) == 2
+    assert conn.commits == 1
+
+
+def test_retries_stop_after_query_retries(database):
+    conn = connect(database, *[errors.SerializationFailure()] * 10)
+
+    with pytest.raises(errors.SerializationFailure):
+        query(database)
+    assert len(conn.statements) == database.query_retries + 1
+
+
+def test_query_canceled_is_not_retried(database):
+    conn = connect(database, errors.QueryCanceled())
+
+    with pytest.raises(errors.QueryCanceled):
+        query(database)
+    assert len(conn.statements) == 1
+
+
+def test_read_is_retried_on_a_new_connection_after_connection_loss(database):
+    lost = FakeConnection([connection_lost])
+    fresh = FakeConnection([[{"id": 1}]])
+    connections = iter([lost, fresh])
+    database.next_connection = lambda: next(connections)
+
+    assert query(database) == [{"id": 1}]
+    assert database.opened == [lost, fresh]
+
+
+def test_write_is_not_retried_after_connection_loss(database):
+    conn = connect(database, connection_lost)
+
+    with pytest.raises(psycopg2.OperationalError):
+        query(database, "UPDATE users SET is_active = FALSE WHERE id = 1")
+    assert len(conn.statements) == 1
+    assert database.opened == [conn]
+
+
+def test_retry_delay_is_capped(database):
+    database.retry_base_delay = 10.0
+    database.retry_max_delay = 0.01
+    connect(database, *[errors.SerializationFailure()] * 3)
+
+    started = time.monotonic()
+    query(database)
+
+    assert time.monotonic() - started < 0.5
+
+
+def test_no_retry_when_delay_exceeds_deadline(database, monkeypatch):
+    # Полный джиттер выбирает верхнюю границу: задержка 1 с не помещается в дедлайн
+    monkeypatch.setattr(database_module.random, "uniform", lambda low, high: high)
+    database.retry_base_delay = 1.0
+    database.retry_max_delay = 1.0
+    conn = connect(database, *[errors.SerializationFailure()] * 10)
+
+    async def with_deadline():
+        statement_deadline.set(time.monotonic() + 0.5)
+        return await database.execute_query_async("SELECT 1")
+
+    started = time.monotonic()
+    with pytest.raises(errors.SerializationFailure):
+        asyncio.run(with_deadline())
+    assert len(conn.statements) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_statement_timeout_is_reset_after_deadline_query(database):
+    conn = connect(database)
+
+    query(database, timeout=2)
+    query(database)
+    query(database)
+
+    assert conn.statements[0].startswith("SET statement_timeout = ")
+    assert "DEFAULT" not in conn.statements[0]
+    assert conn.statements[1].startswith("SET statement_timeout = DEFAULT; ")
+    assert conn.statements[2] == "SELECT 1"
+
+
+def test_statement_timeout_is_reset_after_failed_query(database):
+    # Откат мог вернуть значение, выставленное раньше в той же транзакции
+    conn = connect(database, errors.UniqueViolation())
+
+    with pytest.raises(errors.UniqueViolation):
+        query(database)
+    query(database)
+
+    assert conn.statements[1].startswith("SET statement_timeout = DEFAULT; ")
+
+
+def test_cancelled_task_cancels_query_on_server(database):
+    started = threading.Event()
+
+    def running_until_cancelled(conn):
+        # Запрос "выполняется", пока его не отменят через PQcancel
+        started.set()
+        assert conn.cancelled.wait(5)
+        return errors.QueryCanceled()
+
+    conn = connect(database, running_until_cancelled, [{"id": 1}])
+    state = {}
+
+    async def scenario():
+        state["loop_thread"] = threading.current_thread().name
+        task = asyncio.create_task(database.execute_query_async("SELECT pg_sleep(10)"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Отмененный запрос освободил соединение: следующий выполняется сразу
+        state["next"] = await asyncio.wait_for(database.execute_query_async("SELECT 1"), 1)
+
+    asyncio.run(scenario())
+
+    assert conn.cancel_thread.startswith("db-cancel")
+    assert conn.cancel_thread != state["loop_thread"]
+    assert conn.rollbacks == 1
+    assert state["next"] == [{"id": 1}]
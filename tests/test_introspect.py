@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("jose")
+pytest.importorskip("psycopg2")
+
+from fastapi import Response  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from src.auth import ALGORITHM, INTROSPECTION_CACHE_SECONDS, SECRET_KEY, create_access_token  # noqa: E402
+from src.cache import user_cache  # noqa: E402
+from src.routes import auth  # noqa: E402
+from src.schemas import IntrospectRequest  # noqa: E402
+
+CLAIMS = {"sub": "1", "scope": "auth:introspect"}
+
+
+class FakeDatabase:
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    async def execute_query_async(self, query, params=None, **kwargs):
+        return [{"id": user_id, "is_active": self.statuses[user_id]} for user_id in params[0]]
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch):
+    user_cache.clear()
+    monkeypatch.setattr(auth, "db", FakeDatabase({1: True, 2: False}))
+    yield
+    user_cache.clear()
+
+
+def introspect(tokens):
+    request = IntrospectRequest(tokens=tokens)
+    return asyncio.run(auth.introspect_tokens(request, Response(), claims=CLAIMS)).results
+
+
+def test_token_without_exp_gets_default_ttl():
+    token = jwt.encode({"sub": "1"}, SECRET_KEY, algorithm=ALGORITHM)
+
+    result, = introspect([token])
+
+    assert result.active
+    assert result.exp is None
+    assert result.cache_ttl == INTROSPECTION_CACHE_SECONDS
+
+
+def test_ttl_never_exceeds_token_lifetime():
+    token = create_access_token({"sub": "1"}, expires_delta=timedelta(seconds=5))
+
+    result, = introspect([token])
+
+    assert result.active
+    assert 0 < result.cache_ttl <= 5
+    assert abs(result.exp - (time.time() + 5)) < 2
+
+
+def test_invalid_and_inactive_tokens():
+    inactive = create_access_token({"sub": "2"})
+
+    forged, deactivated = introspect(["not-a-token", inactive])
+
+    assert not forged.active and forged.sub is None
+    assert not deactivated.active and deactivated.user_active is False
+
+
+def test_large_batch_is_decoded_off_the_event_loop(monkeypatch):
+    threads = set()
+    decode = auth.try_decode_token
+
+    def recording_decode(token):
+        threads.add(threading.current_thread() is threading.main_thread())
+        return decode(token)
+
+    monkeypatch.setattr(auth, "try_decode_token", recording_decode)
+    tokens = [create_access_token({"sub": "1", "n": n}) for n in range(auth.INTROSPECT_INLINE_TOKENS + 1)]
+
+    results = introspect(tokens)
+
+    assert all(result.active for result in results)
+    assert threads == {False}
+
+
+def test_small_batch_is_decoded_inline(monkeypatch):
+    threads = set()
+    decode = auth.try_decode_token
+
+    def recording_decode(token):
+        threads.add(threading.current_thread() is threading.main_thread())
+        return decode(token)
+
+    monkeypatch.setattr(auth, "try_decode_token", recording_decode)
+
+    introspect([create_access_token({"sub": "1"})])
+
+    assert threads == {True}
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from src import password_policy  # noqa: E402
+from src.password_policy import (  # noqa: E402
+    BLOOM_HEADER,
+    BLOOM_MAGIC,
+    BreachedPasswordFilter,
+    build_filter,
+    get_breached_filter,
+    validate_password,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BREACHED = [f"Breached{i}!Pass" for i in range(2000)]
+
+
+def sha1(value):
+    return hashlib.sha1(value.encode()).digest()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "pwned.txt"
+    # Формат HIBP: верхний регистр, счетчик через двоеточие, пустые строки пропускаются
+    lines = [f"{sha1(p).hex().upper()}:{i + 1}" for i, p in enumerate(BREACHED)]
+    path.write_text("\n".join(lines) + "\n\n", encoding="ascii")
+    return path
+
+
+@pytest.fixture
+def filter_path(source, tmp_path):
+    path = tmp_path / "pwned.bloom"
+    assert build_filter(str(source), str(path), false_positive_rate=0.01) == len(BREACHED)
+    return path
+
+
+@pytest.fixture
+def configured_filter(monkeypatch):
+    def configure(path):
+        monkeypatch.setenv("BREACHED_PASSWORDS_FILTER", str(path))
+        get_breached_filter.cache_clear()
+
+    yield configure
+    get_breached_filter.cache_clear()
+
+
+def test_header_describes_filter(filter_path):
+    data = filter_path.read_bytes()
+    magic, num_bits, num_hashes, num_items = BLOOM_HEADER.unpack_from(data)
+
+    assert magic == BLOOM_MAGIC
+    assert num_items == len(BREACHED)
+    assert num_hashes >= 1
+    assert len(data) == BLOOM_HEADER.size + (num_bits + 7) // 8
+    assert not os.path.exists(f"{filter_path}.tmp")
+
+
+def test_no_false_negatives(filter_path):
+    bloom = BreachedPasswordFilter(str(filter_path))
+
+    assert all(password in bloom for password in BREACHED)
+
+
+def test_false_positive_rate_within_budget(filter_path):
+    bloom = BreachedPasswordFilter(str(filter_path))
+
+    probes = 20000
+    false_positives = sum(f"Unique{i}?Value" in bloom for i in range(probes))
+
+    # Собрано с долей 0.01; тройной запас против случайных колебаний
+    assert false_positives / probes < 0.03
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "foreign.bin"
+    path.write_bytes(b"NOPE" + bytes(BLOOM_HEADER.size + 16))
+
+    with pytest.raises(ValueError):
+        BreachedPasswordFilter(str(path))
+
+
+def test_rejects_truncated_file(filter_path):
+    data = filter_path.read_bytes()
+    filter_path.write_bytes(data[:-1])
+
+    with pytest.raises(ValueError):
+        BreachedPasswordFilter(str(filter_path))
+
+
+def test_cli_builds_filter(source, tmp_path):
+    target = tmp_path / "cli.bloom"
+
+    result = subprocess.run(
+        [sys.executable, "-m", "src.password_policy", str(source), str(target), "--fp-rate", "0.01"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert str(len(BREACHED)) in result.stdout
+    bloom = BreachedPasswordFilter(str(target))
+    assert bloom.num_items == len(BREACHED)
+    assert BREACHED[0] in bloom
+
+
+def test_validate_password_rejects_breached(filter_path, configured_filter):
+    configured_filter(filter_path)
+
+    with pytest.raises(ValueError, match="утекших"):
+        validate_password(BREACHED[5])
+    assert validate_password("Fresh1!Password") == "Fresh1!Password"
+
+
+def test_misconfigured_path_fails_at_startup(tmp_path, configured_filter):
+    configured_filter(tmp_path / "missing.bloom")
+
+    with pytest.raises(RuntimeError, match="BREACHED_PASSWORDS_FILTER"):
+        get_breached_filter()
+
+
+def test_filter_disabled_without_setting(monkeypatch):
+    monkeypatch.delenv("BREACHED_PASSWORDS_FILTER", raising=False)
+    get_breached_filter.cache_clear()
+
+    assert password_policy.get_breached_filter() is None
@@ -0,0 +1,38 @@
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import psycopg2  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "check_query_plans.py"
+
+
+@pytest.fixture(scope="module")
+def check_query_plans():
+    spec = importlib.util.spec_from_file_location("check_query_plans", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_every_query_has_a_case(check_query_plans):
+    cases = check_query_plans.build_queries(1000)
+
+    assert check_query_plans.uncovered_queries(cases) == []
+
+
+@pytest.mark.postgres
+@pytest.mark.skipif(not os.getenv("QUERY_PLAN_DSN"), reason="QUERY_PLAN_DSN не задан")
+def test_query_plans_within_budget(check_query_plans):
+    # Схема проверки создается рядом с public, где уже применен migrations/init.sql
+    conn = psycopg2.connect(os.environ["QUERY_PLAN_DSN"])
+    try:
+        failures = check_query_plans.run_checks(conn, int(os.getenv("QUERY_PLAN_ROWS", "200000")))
+    finally:
+        conn.close()
+
+    assert failures == []
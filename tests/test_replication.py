@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("jose")
+pytest.importorskip("passlib")
+pytest.importorskip("psycopg2")
+
+from src import replication  # noqa: E402
+from src.database import Database, client_pinned_until, db  # noqa: E402
+from src.replication import (  # noqa: E402
+    READ_YOUR_WRITES_HEADER,
+    ReadYourWritesMiddleware,
+    sign_pin,
+)
+
+
+@pytest.fixture(autouse=True)
+def with_replica(monkeypatch):
+    # Middleware работает, только когда настроены реплики
+    monkeypatch.setattr(db, "replica_dsns", ["dbname=replica"])
+
+
+def run_request(headers=(), write=False):
+    seen = {}
+    sent = []
+
+    async def app(scope, receive, send):
+        seen["pinned_until"] = client_pinned_until.get()
+        if write:
+            db.pin(1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/users/1", "headers": list(headers)}
+    asyncio.run(ReadYourWritesMiddleware(app)(scope, receive, send))
+    return seen["pinned_until"], dict(sent[0]["headers"])
+
+
+def test_write_returns_signed_pin_that_is_honored():
+    _, response_headers = run_request(write=True)
+    pin = response_headers[READ_YOUR_WRITES_HEADER.encode()]
+
+    pinned_until, _ = run_request(headers=[(READ_YOUR_WRITES_HEADER.encode(), pin)])
+
+    assert pinned_until is not None and pinned_until > time.time()
+
+
+def test_signed_pin_cookie_is_honored():
+    cookie = f"{replication.READ_YOUR_WRITES_COOKIE}={sign_pin(time.time() + 2)}".encode()
+
+    pinned_until, _ = run_request(headers=[(b"cookie", cookie)])
+
+    assert pinned_until is not None
+
+
+@pytest.mark.parametrize("value", [
+    f"{time.time() + 2:.3f}",
+    f"{time.time() + 2:.3f}:{'0' * 64}",
+    sign_pin(time.time() + 2).replace(".", "9", 1),
+])
+def test_forged_pin_is_ignored(value):
+    pinned_until, _ = run_request(headers=[(READ_YOUR_WRITES_HEADER.encode(), value.encode())])
+
+    assert pinned_until is None
+
+
+def test_pin_is_capped_to_one_window():
+    pinned_until, _ = run_request(
+        headers=[(READ_YOUR_WRITES_HEADER.encode(), sign_pin(time.time() + 3600).encode())]
+    )
+
+    assert pinned_until <= time.time() + db.read_your_writes_seconds
+
+
+class BlockingConnection:
+    """Соединение, запрос на котором выполняется, пока тест его не отпустит."""
+
+    closed = False
+    statement_timeout_changed = False
+
+    def __init__(self, release):
+        self.release = release
+
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def execute(self, query, params=None):
+        self.release.wait(5)
+        self.description = None
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_lag_check_does_not_queue_behind_queries(monkeypatch):
+    database = Database(primary_dsn="dbname=test", replica_dsns=["dbname=replica"])
+    release = threading.Event()
+    checked = []
+    monkeypatch.setattr(database, "open_connection", lambda dsn: BlockingConnection(release))
+    monkeypatch.setattr(
+        database, "check_replica_lag", lambda index: checked.append(threading.current_thread().name)
+    )
+
+    async def scenario():
+        # Долгие запросы к primary занимают все потоки основного исполнителя
+        queries = [
+            asyncio.ensure_future(database.execute_query_async("SELECT pg_sleep(10)"))
+            for _ in range(1 + len(database.replica_dsns))
+        ]
+        await asyncio.sleep(0.05)
+        try:
+            await asyncio.wait_for(database.check_replicas_async(), 1)
+        finally:
+            release.set()
+            await asyncio.gather(*queries)
+
+    asyncio.run(scenario())
+    database.connection = None
+    database.disconnect()
+
+    assert len(checked) == 1 and checked[0].startswith("db-lag")
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("psycopg2")
+
+from fastapi import HTTPException  # noqa: E402
+
+from src.queries import SEARCH_CANDIDATE_LIMIT, SEARCH_USERS_AFTER_CURSOR_QUERY, SEARCH_USERS_QUERY  # noqa: E402
+from src.routes import users  # noqa: E402
+
+
+def user_row(user_id, rank):
+    return {
+        "id": user_id,
+        "email": f"user{user_id}@example.com",
+        "first_name": "Ivan",
+        "last_name": "Ivanov",
+        "is_active": True,
+        "created_at": datetime(2024, 1, 1),
+        "rank": Decimal(rank),
+    }
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def execute_query_async(self, query, params=None, **kwargs):
+        self.queries.append((query, params))
+        return self.rows[:params["limit"]]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def install(rows):
+        fake = FakeDatabase(rows)
+        monkeypatch.setattr(users, "db", fake)
+        return fake
+
+    return install
+
+
+def search(q, limit=20, cursor=None):
+    return asyncio.run(users.search_users(q=q, limit=limit, cursor=cursor, current_user={"id": 1}))
+
+
+def test_candidate_set_is_bounded_before_ranking():
+    for query in (SEARCH_USERS_QUERY, SEARCH_USERS_AFTER_CURSOR_QUERY):
+        candidates = query.index("LIMIT %(candidates)s")
+        # Кандидаты выбираются по расстоянию из индекса до ранжирования и курсора
+        assert query.index("<<->") < candidates < query.index("ORDER BY rank DESC")
+
+
+def test_first_page_returns_cursor_when_more_rows_exist(database):
+    fake = database([user_row(1, "1.9"), user_row(2, "1.5"), user_row(3, "0.7")])
+
+    response = search("iva_n%", limit=2)
+
+    query, params = fake.queries[0]
+    assert query == SEARCH_USERS_QUERY
+    assert params["prefix"] == "iva\\_n\\%%"
+    assert params["limit"] == 3
+    assert params["candidates"] == SEARCH_CANDIDATE_LIMIT
+    assert [user.id for user in response.users] == [1, 2]
+    assert users._decode_search_cursor(response.next_cursor) == (Decimal("1.5"), 2)
+
+
+def test_next_page_continues_after_cursor(database):
+    fake = database([user_row(3, "0.7")])
+    cursor = users._encode_search_cursor(Decimal("1.5"), 2)
+
+    response = search("ivan", limit=2, cursor=cursor)
+
+    query, params = fake.queries[0]
+    assert query == SEARCH_USERS_AFTER_CURSOR_QUERY
+    assert (params["cursor_rank"], params["cursor_id"]) == (Decimal("1.5"), 2)
+    assert [user.id for user in response.users] == [3]
+    assert response.next_cursor is None
+
+
+def test_invalid_cursor_is_rejected(database):
+    database([])
+
+    with pytest.raises(HTTPException) as raised:
+        search("ivan", cursor="not-a-cursor")
+
+    assert raised.value.status_code == 400
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("psycopg2")
+
+from psycopg2 import errors  # noqa: E402
+
+from src.queries import USER_COUNT_ESTIMATE_QUERY, USER_COUNT_QUERY, USER_PAGE_QUERY  # noqa: E402
+from src.routes import users  # noqa: E402
+
+PAGE = [{
+    "id": 1,
+    "email": "user1@example.com",
+    "first_name": "Ivan",
+    "last_name": "Ivanov",
+    "is_active": True,
+    "created_at": datetime(2024, 1, 1),
+}]
+
+
+class FakeDatabase:
+    """Результат или исключение для каждого запроса по его тексту."""
+
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    async def execute_query_async(self, query, params=None, **kwargs):
+        self.queries.append((query, kwargs))
+        result = self.results[query]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def install(results):
+        fake = FakeDatabase(results)
+        monkeypatch.setattr(users, "db", fake)
+        return fake
+
+    return install
+
+
+def get_users():
+    return asyncio.run(users.get_users(page=1, size=10, current_user={"id": 1}))
+
+
+def test_exact_total(database):
+    fake = database({USER_PAGE_QUERY: PAGE, USER_COUNT_QUERY: [{"count": 1}]})
+
+    response = get_users()
+
+    assert response.total == 1
+    assert not response.total_estimated
+    count_kwargs = next(kwargs for query, kwargs in fake.queries if query == USER_COUNT_QUERY)
+    assert count_kwargs["timeout"] == users.COUNT_TIMEOUT_SECONDS
+
+
+def test_count_timeout_falls_back_to_estimate(database):
+    database({
+        USER_PAGE_QUERY: PAGE,
+        USER_COUNT_QUERY: errors.QueryCanceled(),
+        USER_COUNT_ESTIMATE_QUERY: [{"count": 1200000}],
+    })
+
+    response = get_users()
+
+    assert response.users[0].id == 1
+    assert response.total == 1200000
+    assert response.total_estimated
+
+
+def test_page_timeout_is_raised_for_503(database):
+    database({USER_PAGE_QUERY: errors.QueryCanceled()})
+
+    with pytest.raises(errors.QueryCanceled):
+        get_users()